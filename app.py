@@ -1,14 +1,23 @@
+import functools
+import hashlib
+import hmac
+import json
 import logging
 import os
 import socket
+import sys
+import threading
+import time
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
-import stripe
 import yaml
-from flask import Flask, jsonify, request
+from flask import Flask, Response, request
+from werkzeug.exceptions import RequestEntityTooLarge
 
-from s3_storage import save_binary_file_to_s3, save_file_to_s3
+from db import DatabaseBusyError, execute_prepared, get_db_connection, get_db_pool
+from fina import cleanup_stale_processing_records, process_fina_fiscalization
+from s3_storage import save_binary_file_to_s3, save_file_to_s3, save_to_s3_in_background
 
 
 def validate_payment_intent_data(payment_intent: dict) -> None:
@@ -21,6 +30,25 @@ def validate_payment_intent_data(payment_intent: dict) -> None:
     Raises:
         ValueError: If validation fails
     """
+    # Fast path: a single structural match covers the common well-formed event.
+    # The field-by-field checks below only run to produce a specific error message.
+    match payment_intent:
+        case {
+            "id": str(payment_id),
+            "amount": int(amount),
+            "currency": str(currency),
+            "created": int(created),
+            "status": "succeeded",
+        } if (
+            0 < len(payment_id) <= 200
+            and 0 < amount <= 999999900
+            and len(currency) == 3
+            and currency.isalpha()
+            and created > 0
+            and isinstance(payment_intent.get("metadata"), (dict, type(None)))
+        ):
+            return
+
     # Validate payment_id
     payment_id = payment_intent.get("id")
     if not payment_id or not isinstance(payment_id, str) or len(payment_id) > 200:
@@ -52,22 +80,155 @@ def validate_payment_intent_data(payment_intent: dict) -> None:
         raise ValueError("Invalid metadata format")
 
 
+def verify_stripe_signature(payload: bytes, sig_header: str | None, secret: bytes) -> dict:
+    """
+    Verify Stripe webhook signature and parse the event.
+
+    Equivalent to stripe.Webhook.construct_event() without the SDK object wrapping:
+    HMAC-SHA256 over "{timestamp}.{payload}" compared in constant time against every v1 signature.
+
+    Args:
+        payload: Raw request body
+        sig_header: Value of the Stripe-Signature header
+        secret: Webhook signing secret (whsec_...) as bytes
+
+    Returns:
+        dict: Parsed event
+
+    Raises:
+        ValueError: If the header is malformed, no signature matches, the timestamp is
+            outside the tolerance window or the payload is not a JSON object
+    """
+    if not sig_header:
+        raise ValueError("Missing Stripe-Signature header")
+
+    timestamp = None
+    signatures = []
+    for item in sig_header.split(","):
+        key, _, value = item.strip().partition("=")
+        if key == "t":
+            timestamp = value
+        elif key == "v1":
+            signatures.append(value)
+
+    if not timestamp or not timestamp.isdigit() or not signatures:
+        raise ValueError("Malformed Stripe-Signature header")
+
+    # Feed the payload incrementally instead of concatenating it into a second buffer
+    mac = hmac.new(secret, timestamp.encode() + b".", hashlib.sha256)
+    mac.update(payload)
+    expected = mac.hexdigest()
+    if not any(hmac.compare_digest(expected, signature) for signature in signatures):
+        raise ValueError("No signature matches the expected signature for payload")
+
+    if abs(time.time() - int(timestamp)) > STRIPE_SIGNATURE_TOLERANCE:
+        raise ValueError("Timestamp outside the tolerance zone")
+
+    event = json.loads(payload)
+    if not isinstance(event, dict):
+        raise ValueError("Webhook payload is not a JSON object")
+    return event
+
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+UTC = ZoneInfo("UTC")
+STRIPE_SIGNATURE_TOLERANCE = 300  # seconds, same default as the Stripe SDK
+FINA_CURRENCY = "EUR"
+# INSERT ... ON CONFLICT attempts when the conflicting row disappears before it can be read
+RESERVE_ATTEMPTS = 2
+MAX_WEBHOOK_BYTES = 1024 * 1024  # Stripe events are far smaller, anything bigger is not from Stripe
+# Werkzeug enforces the limit while reading, so chunked bodies without Content-Length are capped too
+app.config["MAX_CONTENT_LENGTH"] = MAX_WEBHOOK_BYTES
+
+# libyaml-backed dumper when PyYAML was built with it, pure-Python fallback otherwise
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+HOSTNAME = socket.gethostname()
+
+# Fiscal system name -> processing entry point
+FISCAL_SYSTEMS = {
+    "fina": process_fina_fiscalization,
+}
+HOST_PID = f"{HOSTNAME}-{os.getpid()}"
+# Turns "YYYY-MM-DDTHH:MM:SS" into the "YYYY-MM-DD-HH-MM-SS" folder timestamp
+FOLDER_TIMESTAMP_TABLE = str.maketrans("T:", "--")
+
+
+def _refresh_host_pid():
+    global HOST_PID
+    HOST_PID = f"{HOSTNAME}-{os.getpid()}"
+
+
+# Worker processes forked from a preloaded app must not reuse the parent's PID in folder names
+os.register_at_fork(after_in_child=_refresh_host_pid)
+
+REQUIRED_ENV_VARS = (
+    "S3_ACCESS_KEY",
+    "S3_SECRET_KEY",
+    "S3_ENDPOINT_URL",
+    "S3_BUCKET_NAME",
+    "STRIPE_WEBHOOK_SECRET",
+    "P12_PATH",
+    "P12_PASSWORD",
+    "FINA_CA_DIR_PATH",
+    "FINA_TIMEZONE",
+    "FINA_ENDPOINT",
+    "OIB_COMPANY",
+    "OIB_OPERATOR",
+    "LOCATION_ID",
+    "REGISTER_ID",
+    "PG_HOST",
+    "PG_PORT",
+    "PG_USER",
+    "PG_PASSWORD",
+    "PG_DB",
+)
+
+
+@functools.cache
+def get_webhook_config():
+    """
+    Read webhook settings from the environment once per process.
 
-def get_db_connection():
-    import psycopg2
+    Cached lazily rather than at import time so /health can still report missing variables.
+    """
+    return {
+        "stripe_webhook_secret": os.environ["STRIPE_WEBHOOK_SECRET"].encode(),
+        "fina_timezone": ZoneInfo(os.environ["FINA_TIMEZONE"]),
+        "location_id": os.environ["LOCATION_ID"],
+        "register_id": os.environ["REGISTER_ID"],
+        "livemode_only": os.environ.get("STRIPE_LIVEMODE_ONLY", "false").lower() in ["1", "true", "yes"],
+    }
 
-    return psycopg2.connect(
-        host=os.environ["PG_HOST"],
-        port=os.environ["PG_PORT"],
-        dbname=os.environ["PG_DB"],
-        user=os.environ["PG_USER"],
-        password=os.environ["PG_PASSWORD"],
-    )
+
+# Hot webhook queries, run as server-side prepared statements (see db.execute_prepared)
+PREPARED_STATEMENTS = {
+    "reserve_fina_receipt": """
+        INSERT INTO fina_receipt (
+            year, location_id, register_id,
+            order_id, stripe_id, amount, currency,
+            payment_time, status, s3_folder_path
+        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, 'processing', $9)
+        ON CONFLICT (stripe_id) DO NOTHING
+        RETURNING receipt_number
+    """,
+    "select_fina_receipt_by_stripe_id": """
+        SELECT id, status, zki, jir, receipt_number FROM fina_receipt WHERE stripe_id = $1
+    """,
+}
+
+
+def json_response(body: dict) -> Response:
+    """
+    Serialize a response body straight to a JSON Response.
+
+    Skips Flask's JSON provider dispatch (and its key sorting) that jsonify() goes through;
+    the stdlib C encoder handles these flat dicts of str/int/float directly.
+    """
+    return Response(json.dumps(body, separators=(",", ":")), mimetype="application/json")
 
 
 def process_payment_intent_webhook():
@@ -75,41 +236,60 @@ def process_payment_intent_webhook():
     Process Stripe payment_intent.succeeded webhook.
 
     Returns:
-        Tuple of (response_dict, status_code)
+        Tuple of (JSON Response from json_response(), status_code)
     """
-    stripe_webhook_secret = os.environ["STRIPE_WEBHOOK_SECRET"]
-    fina_timezone = ZoneInfo(os.environ["FINA_TIMEZONE"])
+    config = get_webhook_config()
+
+    # Reject oversized bodies from the header alone, before reading or hashing anything
+    if request.content_length is not None and request.content_length > MAX_WEBHOOK_BYTES:
+        logger.error(f"Webhook payload too large: {request.content_length} bytes")
+        return json_response({"status": "error", "message": "Payload too large"}), 413
 
-    payload = request.get_data()
+    # Read the body once without Werkzeug keeping a cached copy - the same bytes object is
+    # used for signature verification, JSON parsing and the S3 upload
+    try:
+        payload = request.get_data(cache=False)
+    except RequestEntityTooLarge:
+        logger.error(f"Webhook payload too large: more than {MAX_WEBHOOK_BYTES} bytes")
+        return json_response({"status": "error", "message": "Payload too large"}), 413
     sig_header = request.headers.get("Stripe-Signature")
 
     # Verify webhook signature
     try:
-        event = stripe.Webhook.construct_event(payload, sig_header, stripe_webhook_secret)
+        event = verify_stripe_signature(payload, sig_header, config["stripe_webhook_secret"])
         logger.info(f"Webhook signature verified for event: {event.get('id', 'unknown')}")
     except Exception as e:
         logger.error(f"Webhook signature verification failed: {e}")
-        return jsonify({"status": "error", "message": "Invalid webhook signature"}), 400
+        return json_response({"status": "error", "message": "Invalid webhook signature"}), 400
 
-    # Check event type
-    if event["type"] != "payment_intent.succeeded":
-        logger.info(f"Ignoring event type: {event['type']}")
-        return jsonify({"status": "ignored", "event_type": event["type"]}), 200
+    # Check event type on the plain parsed dict before touching the (possibly large) data object
+    event_type = event.get("type")
+    if event_type != "payment_intent.succeeded":
+        logger.info(f"Ignoring event type: {event_type}")
+        return json_response({"status": "ignored", "event_type": event_type}), 200
 
-    payment_intent = event["data"]["object"]
+    # Test-mode events must never be fiscalized by a production deployment
+    if config["livemode_only"] and event.get("livemode") is False:
+        logger.info(f"Ignoring test mode event: {event.get('id', 'unknown')}")
+        return json_response({"status": "ignored", "event_type": event_type, "livemode": False}), 200
+
+    payment_intent = (event.get("data") or {}).get("object")
+    if not isinstance(payment_intent, dict):
+        logger.error("Webhook data validation failed: missing payment_intent object")
+        return json_response({"status": "error", "message": "Invalid webhook data"}), 400
 
     # Validate webhook data for security
     try:
         validate_payment_intent_data(payment_intent)
     except ValueError as e:
         logger.error(f"Webhook data validation failed: {e}")
-        return jsonify({"status": "error", "message": "Invalid webhook data"}), 400
+        return json_response({"status": "error", "message": "Invalid webhook data"}), 400
 
     # Extract payment data from payment_intent
     payment_id = payment_intent.get("id")
     payment_time = payment_intent.get("created")
-    payment_time_utc = datetime.fromtimestamp(payment_time, tz=ZoneInfo("UTC"))
-    payment_time_local = payment_time_utc.astimezone(fina_timezone)
+    payment_time_utc = datetime.fromtimestamp(payment_time, tz=UTC)
+    payment_time_local = payment_time_utc.astimezone(config["fina_timezone"])
     payment_amount = payment_intent.get("amount", 0) / 100
     payment_currency = payment_intent.get("currency")
 
@@ -117,62 +297,117 @@ def process_payment_intent_webhook():
     metadata = payment_intent.get("metadata", {})
     invoice_id = metadata.get("invoice_id") or metadata.get("order_id") or payment_intent.get("description")
 
-    # Check for idempotency - prevent duplicate processing
-    try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT id, status, zki, jir, receipt_number FROM fina_receipt WHERE stripe_id = %s", [payment_id]
-                )
-                existing_record = cur.fetchone()
-
-                if existing_record:
-                    existing_id, existing_status, existing_zki, existing_jir, existing_receipt_number = existing_record
-                    logger.info(f"Payment {payment_id} already processed with status: {existing_status}")
-
-                    # Return appropriate response based on existing status
-                    if existing_status == "completed":
-                        return (
-                            jsonify(
-                                {
-                                    "status": "success",
-                                    "message": "Payment already processed successfully",
-                                    "payment_amount": payment_amount,
-                                    "ZKI": existing_zki,
-                                    "JIR": existing_jir,
-                                    "receipt_number": existing_receipt_number,
-                                    "idempotent": True,
-                                }
-                            ),
-                            200,
+    # Create folder structure: YYYY-MM-DD-HH-MM-SS-stripe-payment-intent-event_id-hostname-pid (UTC time)
+    # Include hostname and PID to avoid conflicts between dev and production environments
+    event_id = event.get("id", "unknown")
+    payment_time_folder_utc = payment_time_utc.isoformat(timespec="seconds")[:19].translate(FOLDER_TIMESTAMP_TABLE)
+    folder_path = f"{payment_time_folder_utc}-stripe-payment-intent-{event_id}-{HOST_PID}"
+
+    # Idempotency - reserve the receipt row and detect duplicates in a single atomic statement.
+    # Non-EUR payments are rejected later without reserving a receipt number.
+    currency_supported = payment_currency.upper() == FINA_CURRENCY
+    receipt_number = None
+    if currency_supported:
+        try:
+            with get_db_connection(autocommit=True) as conn:
+                with conn.cursor() as cur:
+                    # A conflicting row can vanish (deleted or its stripe_id NULLed during cleanup) between
+                    # the INSERT and the SELECT - the reservation is then simply tried again
+                    existing_record = None
+                    for _ in range(RESERVE_ATTEMPTS):
+                        execute_prepared(
+                            cur,
+                            "reserve_fina_receipt",
+                            PREPARED_STATEMENTS["reserve_fina_receipt"],
+                            [
+                                payment_time_local.year,
+                                config["location_id"],
+                                config["register_id"],
+                                invoice_id,
+                                payment_id,
+                                payment_amount,
+                                payment_currency,
+                                payment_time_local,
+                                folder_path,
+                            ],
                         )
-                    elif existing_status == "processing":
-                        return (
-                            jsonify(
-                                {
-                                    "status": "processing",
-                                    "message": "Payment is currently being processed",
-                                    "receipt_number": existing_receipt_number,
-                                    "idempotent": True,
-                                }
-                            ),
-                            202,
-                        )  # 202 Accepted - processing
-                    else:  # failed status
-                        return (
-                            jsonify(
-                                {
-                                    "status": "failed",
-                                    "message": "Payment processing previously failed",
-                                    "receipt_number": existing_receipt_number,
-                                    "idempotent": True,
-                                }
-                            ),
-                            422,
-                        )  # 422 Unprocessable Entity
-    except Exception as e:
-        logger.error(f"Error checking for existing payment {payment_id}: {e}")
-        # Continue with processing if we can't check - better than failing
+                        reserved = cur.fetchone()
+                        if reserved:
+                            receipt_number = reserved[0]
+                            logger.info(f"Reserved receipt number {receipt_number} for payment {payment_id}")
+                            break
+
+                        execute_prepared(
+                            cur,
+                            "select_fina_receipt_by_stripe_id",
+                            PREPARED_STATEMENTS["select_fina_receipt_by_stripe_id"],
+                            [payment_id],
+                        )
+                        existing_record = cur.fetchone()
+                        if existing_record is not None:
+                            break
+                        logger.warning(f"Conflicting receipt for payment {payment_id} disappeared, retrying")
+                    else:
+                        logger.error(f"Could not reserve or find a receipt for payment {payment_id}")
+                        return json_response({"status": "busy", "message": "Service temporarily unavailable"}), 503
+
+                    if existing_record is not None:
+                        (
+                            existing_id,
+                            existing_status,
+                            existing_zki,
+                            existing_jir,
+                            existing_receipt_number,
+                        ) = existing_record
+                        logger.info(f"Payment {payment_id} already processed with status: {existing_status}")
+
+                        # Return appropriate response based on existing status
+                        if existing_status == "completed":
+                            return (
+                                json_response(
+                                    {
+                                        "status": "success",
+                                        "message": "Payment already processed successfully",
+                                        "payment_amount": payment_amount,
+                                        "ZKI": existing_zki,
+                                        "JIR": existing_jir,
+                                        "receipt_number": existing_receipt_number,
+                                        "idempotent": True,
+                                    }
+                                ),
+                                200,
+                            )
+                        elif existing_status == "processing":
+                            return (
+                                json_response(
+                                    {
+                                        "status": "processing",
+                                        "message": "Payment is currently being processed",
+                                        "receipt_number": existing_receipt_number,
+                                        "idempotent": True,
+                                    }
+                                ),
+                                202,
+                            )  # 202 Accepted - processing
+                        else:  # failed status
+                            return (
+                                json_response(
+                                    {
+                                        "status": "failed",
+                                        "message": "Payment processing previously failed",
+                                        "receipt_number": existing_receipt_number,
+                                        "idempotent": True,
+                                    }
+                                ),
+                                422,
+                            )  # 422 Unprocessable Entity
+        except DatabaseBusyError as e:
+            # Fail fast so Stripe backs off and retries later instead of piling up on a saturated database
+            logger.error(f"Database busy while reserving receipt for payment {payment_id}: {e}")
+            return json_response({"status": "busy", "message": "Service temporarily unavailable"}), 503
+        except Exception as e:
+            logger.error(f"Error reserving receipt for payment {payment_id}: {e}")
+            # Continue with processing - fiscalization will try to reserve the receipt itself
 
     # Prepare data for S3 storage
     payment_time_local_yaml = payment_time_local.strftime("%Y-%m-%d %H:%M:%S")
@@ -184,129 +419,117 @@ def process_payment_intent_webhook():
         "invoice_id": invoice_id,
     }
 
-    # Create folder structure: YYYY-MM-DD-HH-MM-SS-stripe-payment-intent-event_id-hostname-pid (UTC time)
-    # Include hostname and PID to avoid conflicts between dev and production environments
-    event_id = event.get("id", "unknown")
-    hostname = socket.gethostname()
-    pid = os.getpid()
-    payment_time_folder_utc = payment_time_utc.strftime("%Y-%m-%d-%H-%M-%S")
-    folder_path = f"{payment_time_folder_utc}-stripe-payment-intent-{event_id}-{hostname}-{pid}"
-
-    # Save webhook data to S3
-    logger.info(f"Saving webhook data to S3: {folder_path}")
-    save_binary_file_to_s3(payload, f"{folder_path}/stripe-webhook.json")
-    yaml_content = yaml.dump(parsed, allow_unicode=True)
-    save_file_to_s3(yaml_content, f"{folder_path}/stripe-webhook.yaml")
-
-    # Flow configuration: stripe_payment_intent -> fina (currently hardcoded)
-    fiscal_system = "fina"  # TODO: make this configurable
+    # Save webhook data to S3 in the background - uploads overlap with fiscalization
+    logger.info(f"Queueing webhook data upload to S3: {folder_path}")
+    save_to_s3_in_background(save_binary_file_to_s3, payload, f"{folder_path}/stripe-webhook.json")
+    yaml_content = yaml.dump(parsed, Dumper=YAML_DUMPER, allow_unicode=True)
+    save_to_s3_in_background(save_file_to_s3, yaml_content, f"{folder_path}/stripe-webhook.yaml")
+
+    # Flow: stripe_payment_intent -> fina. The reservation and EUR check above are FINA-specific,
+    # so a new fiscal system needs its own FISCAL_SYSTEMS entry and flow, not just another key here
+    fiscal_system = "fina"
     logger.info(f"Processing payment with fiscal system: {fiscal_system}")
 
-    if fiscal_system == "fina":
-        # FINA requires EUR currency only
-        if payment_currency.upper() != "EUR":
-            logger.error(f"FINA fiscalization requires EUR currency, got: {payment_currency}")
-            result = {
-                "status": "error",
-                "message": f"FINA fiscalization only supports EUR currency, received: {payment_currency}",
-                "payment_id": payment_id,
-                "payment_currency": payment_currency,
-            }
-            return jsonify(result), 422  # 422 Unprocessable Entity
-
-        from fina import process_fina_fiscalization
-
-        result = process_fina_fiscalization(
-            payment_id,
-            payment_time_local,
-            payment_amount,
-            payment_currency,
-            invoice_id,
-            folder_path,  # Pass the shared folder path
-        )
-        if result.get("JIR"):
-            logger.info(f"Fiscalization successful - JIR: {result.get('JIR')}, ZKI: {result.get('ZKI')}")
-        else:
-            logger.warning(f"Fiscalization failed - no JIR received: {result}")
-    else:
-        logger.error(f"Unsupported fiscal system: {fiscal_system}")
+    # FINA requires EUR currency only
+    if not currency_supported:
+        logger.error(f"FINA fiscalization requires EUR currency, got: {payment_currency}")
         result = {
             "status": "error",
-            "message": f"Unsupported fiscal system: {fiscal_system}",
+            "message": f"FINA fiscalization only supports EUR currency, received: {payment_currency}",
+            "payment_id": payment_id,
+            "payment_currency": payment_currency,
         }
+        return json_response(result), 422  # 422 Unprocessable Entity
+
+    result = FISCAL_SYSTEMS[fiscal_system](
+        payment_id,
+        payment_time_local,
+        payment_amount,
+        payment_currency,
+        invoice_id,
+        folder_path,  # Pass the shared folder path
+        receipt_number=receipt_number,  # Already reserved above (None if reservation failed)
+    )
+    if result.get("JIR"):
+        logger.info(f"Fiscalization successful - JIR: {result.get('JIR')}, ZKI: {result.get('ZKI')}")
+    else:
+        logger.warning(f"Fiscalization failed - no JIR received: {result}")
+
+    return json_response(result), 200
+
 
-    return jsonify(result), 200
+HEALTH_DB_PING_INTERVAL = 2  # seconds a successful database ping is trusted
+HEALTH_CLEANUP_INTERVAL = 300  # seconds between stale record cleanups
+# Set to "false" when an external scheduler runs `fina_cli.py --cleanup-stale` instead
+HEALTH_STALE_CLEANUP = os.environ.get("HEALTH_STALE_CLEANUP", "true").lower() != "false"
+
+_health_state = {"last_db_ping": float("-inf"), "last_cleanup": float("-inf")}
+_health_lock = threading.Lock()
+
+
+def _run_stale_record_cleanup():
+    try:
+        cleaned_count = cleanup_stale_processing_records(max_age_minutes=30)
+        logger.info(f"Health check cleanup: {cleaned_count} stale records processed")
+    except Exception as cleanup_error:
+        # Don't fail health check if cleanup fails
+        logger.warning(f"Cleanup during health check failed: {cleanup_error}")
+
+
+def schedule_stale_record_cleanup(now: float) -> None:
+    """Start a background stale record cleanup if the last one ran more than HEALTH_CLEANUP_INTERVAL ago."""
+    with _health_lock:
+        if now - _health_state["last_cleanup"] < HEALTH_CLEANUP_INTERVAL:
+            return
+        _health_state["last_cleanup"] = now
+    threading.Thread(target=_run_stale_record_cleanup, name="stale-cleanup", daemon=True).start()
 
 
 @app.route("/health", methods=["GET"])
 def health_check():
     logger.info("Health check requested")
 
-    # Required environment variables
-    required_env_vars = [
-        "S3_ACCESS_KEY",
-        "S3_SECRET_KEY",
-        "S3_ENDPOINT_URL",
-        "S3_BUCKET_NAME",
-        "STRIPE_WEBHOOK_SECRET",
-        "P12_PATH",
-        "P12_PASSWORD",
-        "FINA_CA_DIR_PATH",
-        "FINA_TIMEZONE",
-        "FINA_ENDPOINT",
-        "OIB_COMPANY",
-        "OIB_OPERATOR",
-        "LOCATION_ID",
-        "REGISTER_ID",
-        "PG_HOST",
-        "PG_PORT",
-        "PG_USER",
-        "PG_PASSWORD",
-        "PG_DB",
-    ]
-
     # Check for missing environment variables
-    missing_vars = [var for var in required_env_vars if not os.environ.get(var)]
+    missing_vars = [var for var in REQUIRED_ENV_VARS if not os.environ.get(var)]
     if missing_vars:
         logger.error(f"Health check failed: Missing environment variables: {', '.join(missing_vars)}")
         return (
-            jsonify(
+            json_response(
                 {
                     "status": "unhealthy",
                     "environment": "incomplete",
                     "missing_vars": missing_vars,
                     "error": "Required environment variables not set",
-                    "timestamp": datetime.now(ZoneInfo("UTC")).isoformat(),
+                    "timestamp": datetime.now(UTC).isoformat(),
                 }
             ),
             503,
         )
 
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT 1")
-                cur.fetchone()
+        # Probes arrive every few seconds - reuse a recent successful ping instead of querying each time
+        now = time.monotonic()
+        if now - _health_state["last_db_ping"] > HEALTH_DB_PING_INTERVAL:
+            with get_db_connection(autocommit=True) as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                    cur.fetchone()
+            _health_state["last_db_ping"] = now
 
         # Cleanup stale processing records during health checks
-        # This runs periodically when health checks are called by monitoring systems
-        try:
-            from fina import cleanup_stale_processing_records
-
-            cleaned_count = cleanup_stale_processing_records(max_age_minutes=30)
-            logger.info(f"Health check cleanup: {cleaned_count} stale records processed")
-        except Exception as cleanup_error:
-            logger.warning(f"Cleanup during health check failed: {cleanup_error}")
-            # Don't fail health check if cleanup fails
+        # Throttled to once per HEALTH_CLEANUP_INTERVAL and run in the background so the probe stays fast
+        if HEALTH_STALE_CLEANUP:
+            schedule_stale_record_cleanup(now)
 
         logger.info("Health check passed")
         return (
-            jsonify(
+            json_response(
                 {
                     "status": "healthy",
                     "database": "connected",
+                    "database_pool": get_db_pool().stats(),
                     "environment": "complete",
-                    "timestamp": datetime.now(ZoneInfo("UTC")).isoformat(),
+                    "timestamp": datetime.now(UTC).isoformat(),
                 }
             ),
             200,
@@ -314,13 +537,13 @@ def health_check():
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         return (
-            jsonify(
+            json_response(
                 {
                     "status": "unhealthy",
                     "database": "disconnected",
                     "environment": "complete",
                     "error": "Database connection failed",
-                    "timestamp": datetime.now(ZoneInfo("UTC")).isoformat(),
+                    "timestamp": datetime.now(UTC).isoformat(),
                 }
             ),
             503,
@@ -335,6 +558,7 @@ def stripe_payment_intent_webhook():
 
 
 if __name__ == "__main__":
-    # Only enable debug mode in development environment
-    debug_mode = os.environ.get("APP_ENV", "production").lower() in ["dev", "development"]
-    app.run(debug=debug_mode)
+    # The Flask development server is for local development only - production runs under Gunicorn
+    if os.environ.get("APP_ENV", "production").lower() not in ["dev", "development"]:
+        sys.exit("Use 'gunicorn --config gunicorn_conf.py app:app' outside of development (APP_ENV=dev)")
+    app.run(debug=True)
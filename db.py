@@ -0,0 +1,198 @@
+"""
+PostgreSQL connection pool shared by the webhook app, FINA fiscalization and the CLI.
+
+One pool per process, created on first use and rebuilt after fork (Gunicorn preloads the app).
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+logger = logging.getLogger(__name__)
+
+_pg_pool = None
+_pg_pool_slots = None
+_pg_pool_lock = threading.Lock()
+
+PG_CHECKOUT_ATTEMPTS = 3
+PG_POOL_TIMEOUT = float(os.environ.get("PG_POOL_TIMEOUT", "5"))
+
+
+class DatabaseBusyError(Exception):
+    """Raised when no pooled database connection becomes available in time."""
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that tracks its age, usage and the server-side prepared statements it holds."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.uses = 0
+
+
+class RotatingConnectionPool(ThreadedConnectionPool):
+    """
+    ThreadedConnectionPool that retires old, overused and long-idle connections.
+
+    Connections silently go bad behind NAT timeouts or server-side resets; rotating them
+    keeps the first request after a quiet period from stalling on a dead socket.
+    """
+
+    def __init__(self, minconn, maxconn, *args, max_lifetime=300.0, idle_timeout=60.0, max_uses=1000, **kwargs):
+        self.max_lifetime = max_lifetime
+        self.idle_timeout = idle_timeout
+        self.max_uses = max_uses
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        # minconn connections are opened up front, but psycopg2 also uses minconn as the number of
+        # returned connections it keeps, closing the rest. Keep up to maxconn so concurrent
+        # checkouts reuse warm connections (and their prepared statements); idle_timeout still
+        # retires the ones that sit unused.
+        self.minconn = maxconn
+
+    def getconn(self, key=None):
+        conn = super().getconn(key)
+        if time.monotonic() - conn.last_used_at > self.idle_timeout:
+            # Idle too long to trust - replace it with a fresh connection
+            super().putconn(conn, key, close=True)
+            conn = super().getconn(key)
+        conn.uses += 1
+        return conn
+
+    def putconn(self, conn, key=None, close=False):
+        now = time.monotonic()
+        if now - conn.created_at > self.max_lifetime or conn.uses >= self.max_uses:
+            close = True
+        conn.last_used_at = now
+        super().putconn(conn, key, close=close)
+
+    def stats(self) -> dict:
+        """Current pool usage (for the health check)."""
+        with self._lock:
+            return {"in_use": len(self._used), "idle": len(self._pool), "max": self.maxconn}
+
+
+def get_db_pool():
+    """
+    Return the process-wide PostgreSQL connection pool, creating it on first use.
+
+    The pool is created lazily (not at import time) so the app can start and report
+    an unhealthy database via /health instead of failing to import.
+    """
+    global _pg_pool, _pg_pool_slots
+
+    if _pg_pool is None:
+        with _pg_pool_lock:
+            if _pg_pool is None:
+                maxconn = int(os.environ.get("PG_POOL_MAX", "10"))
+                statement_timeout_ms = int(os.environ.get("PG_STATEMENT_TIMEOUT_MS", "5000"))
+                # Semaphore bounds checkouts to pool size so waiting callers can time out
+                # (ThreadedConnectionPool.getconn raises immediately when exhausted)
+                _pg_pool_slots = threading.BoundedSemaphore(maxconn)
+                _pg_pool = RotatingConnectionPool(
+                    minconn=int(os.environ.get("PG_POOL_MIN", "1")),
+                    maxconn=maxconn,
+                    max_lifetime=float(os.environ.get("PG_CONN_MAX_LIFETIME", "300")),
+                    idle_timeout=float(os.environ.get("PG_CONN_IDLE_TIMEOUT", "60")),
+                    host=os.environ["PG_HOST"],
+                    port=os.environ["PG_PORT"],
+                    dbname=os.environ["PG_DB"],
+                    user=os.environ["PG_USER"],
+                    password=os.environ["PG_PASSWORD"],
+                    connection_factory=PooledConnection,
+                    # Prevent a single slow query or forgotten transaction from pinning a pool slot
+                    options=(
+                        f"-c statement_timeout={statement_timeout_ms} "
+                        f"-c idle_in_transaction_session_timeout={statement_timeout_ms}"
+                    ),
+                    # TCP keepalives detect dead pooled sockets before a request hits them
+                    keepalives=1,
+                    keepalives_idle=30,
+                    keepalives_interval=10,
+                    keepalives_count=3,
+                )
+    return _pg_pool
+
+
+def checkout_db_connection(pool):
+    """
+    Take a connection from the pool, waiting at most PG_POOL_TIMEOUT seconds for a free slot.
+
+    Opening a new connection is retried up to PG_CHECKOUT_ATTEMPTS times before giving up.
+
+    Raises:
+        DatabaseBusyError: If no connection is available in time
+    """
+    if not _pg_pool_slots.acquire(timeout=PG_POOL_TIMEOUT):
+        raise DatabaseBusyError(f"No database connection available within {PG_POOL_TIMEOUT}s")
+
+    for attempt in range(1, PG_CHECKOUT_ATTEMPTS + 1):
+        try:
+            return pool.getconn()
+        except psycopg2.OperationalError as e:
+            if attempt == PG_CHECKOUT_ATTEMPTS:
+                _pg_pool_slots.release()
+                raise DatabaseBusyError(f"Could not open database connection: {e}") from e
+            logger.warning(f"Database connection attempt {attempt} failed: {e}")
+            time.sleep(0.1 * attempt)
+
+
+def _reset_db_pool_after_fork():
+    """Drop the parent's pool in a forked worker - psycopg2 connections must not be shared across processes."""
+    global _pg_pool, _pg_pool_slots, _pg_pool_lock
+    _pg_pool = None
+    _pg_pool_slots = None
+    _pg_pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_db_pool_after_fork)
+
+
+@contextmanager
+def get_db_connection(autocommit=False):
+    """
+    Check out a pooled database connection for the duration of a `with` block.
+
+    Commits on success, rolls back on error and always returns the connection to the pool.
+    Connections found closed (e.g. after a server restart) are discarded instead of reused.
+
+    Args:
+        autocommit: Run each statement in its own implicit transaction. For single-statement
+            operations this saves the separate BEGIN and COMMIT round trips psycopg2 otherwise sends.
+    """
+    pool = get_db_pool()
+    conn = checkout_db_connection(pool)
+    try:
+        conn.autocommit = autocommit
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+        _pg_pool_slots.release()
+
+
+def execute_prepared(cur, name: str, sql: str, params: list) -> None:
+    """
+    Execute sql as server-side prepared statement `name`, preparing it on the connection the first time.
+
+    Prepared statements are session-level, so each pooled connection prepares a statement once and
+    Postgres skips parse/plan on every later call. sql uses $1, $2, ... placeholders.
+    """
+    conn = cur.connection
+    if name not in conn.prepared_statements:
+        cur.execute(f"PREPARE {name} AS {sql}")
+        conn.prepared_statements.add(name)
+    placeholders = ", ".join(["%s"] * len(params))
+    cur.execute(f"EXECUTE {name} ({placeholders})", params)
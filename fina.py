@@ -1,11 +1,19 @@
+import functools
+import glob
 import hashlib
+import io
 import logging
 import os
+import re
+import ssl
+import tarfile
+import tempfile
+import threading
+import time
 import uuid
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
-import psycopg2
 import requests
 import xmlsec
 import yaml
@@ -16,13 +24,17 @@ from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives.serialization import Encoding, NoEncryption, PrivateFormat, pkcs12
 from lxml import etree as ET
 from psycopg2.extras import RealDictCursor
+from requests.adapters import HTTPAdapter
 
-from s3_storage import save_file_to_s3
+from db import get_db_connection
+from s3_storage import save_binary_file_to_s3, save_files_to_s3
 
 logger = logging.getLogger(__name__)
 
 
+@functools.cache
 def get_config():
+    """Read FINA settings from the environment once per process (they are fixed at startup)."""
     return {
         "fina_timezone": ZoneInfo(os.environ["FINA_TIMEZONE"]),
         "p12_path": os.environ["P12_PATH"],
@@ -32,31 +44,57 @@ def get_config():
         "oib_operator": os.environ["OIB_OPERATOR"],
         "location_id": os.environ["LOCATION_ID"],
         "register_id": os.environ["REGISTER_ID"],
+        "ca_dir": os.environ.get("FINA_CA_DIR_PATH"),
     }
 
 
+# libyaml-backed dumper when PyYAML was built with it, pure-Python fallback otherwise
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# Implicit tag resolution (is "10.00" a float, "true" a bool?) - the same rules SafeDumper applies
+_YAML_RESOLVER = yaml.resolver.Resolver()
+# Scalars SafeDumper writes unquoted, provided they resolve to a plain string
+_YAML_PLAIN_SCALAR = re.compile(r"\w[\w.:-]*(?<!:)")
+# Single-line printable text that reloads unchanged from single quotes. U+2028/U+2029 are YAML
+# line breaks and U+FEFF a BOM, so values containing them go to yaml.dump for double-quoted escapes
+_YAML_SINGLE_QUOTABLE = re.compile(
+    "[\x20-\x7e\xa0-\u2027\u202a-\ud7ff\ue000-\ufefe\uff00-\ufffd\U00010000-\U0010ffff]*"
+)
+
 FILE_REQUEST = "fina-request"
 FILE_RESPONSE = "fina-response"
+FILE_AUDIT_TAR = "fina-audit.tar"
 
+# Upload the four FINA audit files as one fina-audit.tar (a single PUT) instead of four objects.
+# Off by default - downstream tools expect the individual files.
+FINA_S3_AUDIT_TARBALL = os.environ.get("FINA_S3_AUDIT_TARBALL", "false").lower() == "true"
 
-def get_db_connection():
-    return psycopg2.connect(
-        host=os.environ["PG_HOST"],
-        port=os.environ["PG_PORT"],
-        dbname=os.environ["PG_DB"],
-        user=os.environ["PG_USER"],
-        password=os.environ["PG_PASSWORD"],
-    )
+# One FINA host; pool_maxsize covers every gunicorn thread of a worker with headroom so
+# concurrent fiscalizations each reuse a kept-alive connection instead of opening a throwaway one
+FINA_POOL_CONNECTIONS = 4
+FINA_POOL_MAXSIZE = 16
 
 
 def reserve_receipt_number(
-    year, location_id, register_id, order_id, stripe_id, amount, currency, payment_time, s3_folder_path
+    year,
+    location_id,
+    register_id,
+    order_id,
+    stripe_id,
+    amount,
+    currency,
+    payment_time,
+    s3_folder_path,
+    status="processing",
 ):
     """
     Atomically reserve the next receipt number by inserting a new row with 'processing' status.
     Uses PostgreSQL sequence for atomic receipt number generation, eliminating race conditions.
+
+    Pass status='queued' to only enqueue the receipt; claim_queued_receipts() hands it to a worker later.
     """
-    with get_db_connection() as conn:
+    # Single statement - autocommit sends it in one round trip without BEGIN/COMMIT
+    with get_db_connection(autocommit=True) as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             # Insert new row with 'processing' status - sequence automatically assigns receipt_number
             # receipt_created and receipt_updated are set automatically by database defaults
@@ -66,24 +104,76 @@ def reserve_receipt_number(
                     year, location_id, register_id,
                     order_id, stripe_id, amount, currency,
                     zki, jir, payment_time, status, s3_folder_path
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, NULL, NULL, %s, 'processing', %s)
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, NULL, NULL, %s, %s, %s)
                 RETURNING receipt_number
                 """,
-                [year, location_id, register_id, order_id, stripe_id, amount, currency, payment_time, s3_folder_path],
+                [
+                    year,
+                    location_id,
+                    register_id,
+                    order_id,
+                    stripe_id,
+                    amount,
+                    currency,
+                    payment_time,
+                    status,
+                    s3_folder_path,
+                ],
             )
             row = cur.fetchone()
             receipt_number = row["receipt_number"]
             conn.commit()
 
-            logger.info(f"Reserved receipt number {receipt_number} for year {year} (stripe_id: {stripe_id})")
+            logger.info(
+                f"Reserved receipt number {receipt_number} for year {year} (stripe_id: {stripe_id}, status: {status})"
+            )
             return receipt_number
 
 
+def claim_queued_receipts(limit=100):
+    """
+    Claim up to limit 'queued' receipts for fiscalization by flipping them to 'processing'.
+
+    FOR UPDATE SKIP LOCKED lets several workers drain the queue concurrently without
+    claiming the same receipt twice. Claimed rows are then covered by
+    cleanup_stale_processing_records() like any other 'processing' row.
+
+    Returns:
+        list: Claimed receipt rows (dicts), oldest first
+    """
+    with get_db_connection(autocommit=True) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                UPDATE fina_receipt
+                SET status = 'processing', receipt_updated = CURRENT_TIMESTAMP
+                WHERE id IN (
+                    SELECT id FROM fina_receipt
+                    WHERE status = 'queued'
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, receipt_number, order_id, stripe_id, amount, currency, payment_time, s3_folder_path
+                """,
+                [limit],
+            )
+            claimed = sorted(cur.fetchall(), key=lambda row: row["id"])
+
+    if claimed:
+        logger.info(f"Claimed {len(claimed)} queued receipt(s) for fiscalization")
+    return claimed
+
+
 def update_receipt_with_fiscalization(stripe_id, zki, jir, status):
     """
     Update the reserved receipt record with fiscalization results.
+
+    Single UPDATE with the rowcount as existence check (no separate SELECT), run in autocommit
+    mode so it costs one round trip. Deliberately not filtered on status = 'processing': a slow
+    fiscalization whose row was already marked stale must still record its JIR.
     """
-    with get_db_connection() as conn:
+    with get_db_connection(autocommit=True) as conn:
         with conn.cursor() as cur:
             cur.execute(
                 """
@@ -112,14 +202,16 @@ def cleanup_stale_processing_records(max_age_minutes=30):
     Returns:
         int: Number of records cleaned up
     """
-    with get_db_connection() as conn:
+    with get_db_connection(autocommit=True) as conn:
         with conn.cursor() as cur:
+            # receipt_updated, not receipt_created: a receipt that waited in the queue only
+            # starts ageing once a worker claims it
             cur.execute(
                 """
                 UPDATE fina_receipt
                 SET status = 'failed', receipt_updated = CURRENT_TIMESTAMP
                 WHERE status = 'processing'
-                AND receipt_created < NOW() - INTERVAL '%s minutes'
+                AND receipt_updated < NOW() - INTERVAL '%s minutes'
                 RETURNING stripe_id, receipt_number
                 """,
                 [max_age_minutes],
@@ -143,10 +235,14 @@ def process_fina_fiscalization(
     payment_currency,
     invoice_id,
     shared_folder_path,
+    receipt_number=None,
 ):
     """
     Process FINA fiscalization for a payment.
 
+    If receipt_number is given, the 'processing' row was already reserved by the caller
+    (the webhook reserves it atomically as part of its idempotency check) and step 1 is skipped.
+
     IMPORTANT: Database operations are intentionally NOT wrapped in a single transaction.
     This prevents losing successful fiscalizations if later database updates fail.
     The pattern is:
@@ -156,26 +252,29 @@ def process_fina_fiscalization(
 
     If step 3 fails, we have the fiscalization result but a 'processing' record.
     This is preferable to losing a successful fiscalization due to rollback.
+    Steps 1 and 3 therefore stay separate statements; each is a single autocommit round trip.
     Stale 'processing' records can be cleaned up with cleanup_stale_processing_records().
     """
-    location_id = os.environ["LOCATION_ID"]
-    register_id = os.environ["REGISTER_ID"]
+    config = get_config()
+    location_id = config["location_id"]
+    register_id = config["register_id"]
     year = payment_time.year
 
     logger.info(f"Starting fiscalization for payment {payment_id}, year: {year}")
 
     # Step 1: Reserve receipt number by inserting record with 'processing' status
-    receipt_number = reserve_receipt_number(
-        year,
-        location_id,
-        register_id,
-        invoice_id,
-        payment_id,
-        payment_amount,
-        payment_currency,
-        payment_time,
-        shared_folder_path,
-    )
+    if receipt_number is None:
+        receipt_number = reserve_receipt_number(
+            year,
+            location_id,
+            register_id,
+            invoice_id,
+            payment_id,
+            payment_amount,
+            payment_currency,
+            payment_time,
+            shared_folder_path,
+        )
 
     try:
         # Step 2: Perform fiscalization
@@ -215,7 +314,9 @@ def process_fina_fiscalization(
         raise ValueError(f"Fiscalization failed for payment {payment_id}: {str(e)}") from e
 
 
-def extract_cert_key(p12_path, password):
+@functools.lru_cache(maxsize=4)
+def _load_p12(p12_path, mtime, password):
+    # mtime is part of the cache key so a replaced certificate file is picked up without a restart
     with open(p12_path, "rb") as f:
         p12_data = f.read()
     priv_key, cert, _ = pkcs12.load_key_and_certificates(p12_data, password.encode(), backend=default_backend())
@@ -224,47 +325,109 @@ def extract_cert_key(p12_path, password):
     return cert_pem, key_pem, priv_key
 
 
+def extract_cert_key(p12_path, password):
+    """Return (cert_pem, key_pem, private_key) from the PKCS#12 file, parsed once per file version."""
+    return _load_p12(p12_path, os.stat(p12_path).st_mtime_ns, password)
+
+
+def _uuid7():
+    """
+    Time-ordered UUID version 7 (RFC 9562): 48-bit Unix millisecond timestamp followed by random bits.
+
+    Consecutive ids sort by creation time, so an index over them is appended at the right edge
+    instead of receiving random inserts. Uses uuid.uuid7() where the stdlib has it (3.14+).
+    """
+    timestamp_ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")
+    value = (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80  # unix_ts_ms
+    value |= 0x7 << 76  # version
+    value |= (rand >> 62 & 0xFFF) << 64  # rand_a
+    value |= 0b10 << 62  # variant
+    value |= rand & 0x3FFF_FFFF_FFFF_FFFF  # rand_b
+    return uuid.UUID(int=value)
+
+
+uuid7 = getattr(uuid, "uuid7", _uuid7)
+
+
 def generate_zki(oib, dt, br, pos, ur, amount, private_key):
     data = f"{oib}{dt}{br}{pos}{ur}{float(amount):.2f}"
     signed = private_key.sign(data.encode("utf-8"), padding.PKCS1v15(), hashes.SHA1())
-    return hashlib.md5(signed).hexdigest()
+    # MD5 is mandated by the FINA ZKI spec, not used as a security primitive - also works on FIPS builds
+    return hashlib.md5(signed, usedforsecurity=False).hexdigest()
+
+
+FINA_NS = "http://www.apis-it.hr/fin/2012/types/f73"
+XSI_NS = "http://www.w3.org/2001/XMLSchema-instance"
 
 
 def build_receipt(message_id, node_id, request_time, payment_time, zki, total, receipt_number, config):
-    receipt = f"""<tns:RacunZahtjev xmlns:tns="http://www.apis-it.hr/fin/2012/types/f73"
-             Id="{node_id}"
-             xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-             xsi:schemaLocation="http://www.apis-it.hr/fin/2012/types/f73 ../schema/FiskalizacijaSchema.xsd">
-        <tns:Zaglavlje>
-            <tns:IdPoruke>{message_id}</tns:IdPoruke>
-            <tns:DatumVrijeme>{request_time}</tns:DatumVrijeme>
-        </tns:Zaglavlje>
-        <tns:Racun>
-            <tns:Oib>{config['oib_company']}</tns:Oib>
-            <tns:USustPdv>true</tns:USustPdv>
-            <tns:DatVrijeme>{payment_time}</tns:DatVrijeme>
-            <tns:OznSlijed>P</tns:OznSlijed>
-            <tns:BrRac>
-                <tns:BrOznRac>{receipt_number}</tns:BrOznRac>
-                <tns:OznPosPr>{config['location_id']}</tns:OznPosPr>
-                <tns:OznNapUr>{config['register_id']}</tns:OznNapUr>
-            </tns:BrRac>
-            <tns:IznosOslobPdv>{total}</tns:IznosOslobPdv>
-            <tns:IznosUkupno>{total}</tns:IznosUkupno>
-            <tns:NacinPlac>K</tns:NacinPlac>
-            <tns:OibOper>{config['oib_operator']}</tns:OibOper>
-            <tns:ZastKod>{zki}</tns:ZastKod>
-            <tns:NakDost>false</tns:NakDost>
-        </tns:Racun>
-    </tns:RacunZahtjev>"""
-
-    return receipt
-
-
-def sign_with_cert(xml_string, cert_pem, key_pem, node_id):
-    parser = ET.XMLParser(remove_blank_text=True)
-    root = ET.fromstring(xml_string.encode(), parser)
+    """
+    Build the RacunZahtjev element tree directly (no template string to re-parse).
 
+    Field values are assigned as element text, so lxml escapes them.
+    """
+    tns = f"{{{FINA_NS}}}"
+    root = ET.Element(f"{tns}RacunZahtjev", nsmap={"tns": FINA_NS, "xsi": XSI_NS})
+    root.set("Id", node_id)
+    root.set(f"{{{XSI_NS}}}schemaLocation", f"{FINA_NS} ../schema/FiskalizacijaSchema.xsd")
+
+    def add(parent, name, text=None):
+        el = ET.SubElement(parent, f"{tns}{name}")
+        if text is not None:
+            el.text = str(text)
+        return el
+
+    header = add(root, "Zaglavlje")
+    add(header, "IdPoruke", message_id)
+    add(header, "DatumVrijeme", request_time)
+
+    racun = add(root, "Racun")
+    add(racun, "Oib", config["oib_company"])
+    add(racun, "USustPdv", "true")
+    add(racun, "DatVrijeme", payment_time)
+    add(racun, "OznSlijed", "P")
+    br_rac = add(racun, "BrRac")
+    add(br_rac, "BrOznRac", receipt_number)
+    add(br_rac, "OznPosPr", config["location_id"])
+    add(br_rac, "OznNapUr", config["register_id"])
+    add(racun, "IznosOslobPdv", total)
+    add(racun, "IznosUkupno", total)
+    add(racun, "NacinPlac", "K")
+    add(racun, "OibOper", config["oib_operator"])
+    add(racun, "ZastKod", zki)
+    add(racun, "NakDost", "false")
+
+    return root
+
+
+@functools.lru_cache(maxsize=4)
+def cert_issuer_serial(cert_pem):
+    """Return (issuer_name, serial_number) strings for X509IssuerSerial, parsed once per certificate."""
+    cert_obj = x509.load_pem_x509_certificate(cert_pem, default_backend())
+    return cert_obj.issuer.rfc4514_string(), str(cert_obj.serial_number)
+
+
+_signing_keys = threading.local()
+
+
+def get_signing_key(cert_pem, key_pem):
+    """
+    Return an xmlsec.Key loaded from the PEMs, reused by the calling thread while the certificate is unchanged.
+
+    xmlsec keys are not shared between threads, so each thread keeps its own copy.
+    """
+    cached = getattr(_signing_keys, "entry", None)
+    if cached is None or cached[0] != (cert_pem, key_pem):
+        key = xmlsec.Key.from_memory(key_pem, xmlsec.KeyFormat.PEM)
+        key.load_cert_from_memory(cert_pem, xmlsec.KeyFormat.PEM)
+        cached = ((cert_pem, key_pem), key)
+        _signing_keys.entry = cached
+    return cached[1]
+
+
+def sign_with_cert(root, cert_pem, key_pem, node_id):
+    """Sign the receipt element in place (enveloped signature) and return it serialized."""
     root.set("Id", node_id)
 
     xmlsec.tree.add_ids(root, ["Id"])
@@ -279,18 +442,17 @@ def sign_with_cert(xml_string, cert_pem, key_pem, node_id):
     x509_data = xmlsec.template.add_x509_data(key_info)
     xmlsec.template.x509_data_add_certificate(x509_data)
 
-    cert_obj = x509.load_pem_x509_certificate(cert_pem, default_backend())
+    issuer_name, serial_number = cert_issuer_serial(cert_pem)
     issuer_el = ET.SubElement(x509_data, "{http://www.w3.org/2000/09/xmldsig#}X509IssuerSerial")
     name_el = ET.SubElement(issuer_el, "{http://www.w3.org/2000/09/xmldsig#}X509IssuerName")
-    name_el.text = cert_obj.issuer.rfc4514_string()
+    name_el.text = issuer_name
     serial_el = ET.SubElement(issuer_el, "{http://www.w3.org/2000/09/xmldsig#}X509SerialNumber")
-    serial_el.text = str(cert_obj.serial_number)
+    serial_el.text = serial_number
 
     root.append(signature)
+    # A fresh SignatureContext per signature is required; only the loaded key is reused
     ctx = xmlsec.SignatureContext()
-    key = xmlsec.Key.from_memory(key_pem, xmlsec.KeyFormat.PEM)
-    key.load_cert_from_memory(cert_pem, xmlsec.KeyFormat.PEM)
-    ctx.key = key
+    ctx.key = get_signing_key(cert_pem, key_pem)
     ctx.sign(signature)
 
     return ET.tostring(root, encoding="utf-8").decode()
@@ -305,108 +467,216 @@ def wrap_soap(xml_signed):
 </soapenv:Envelope>"""
 
 
-def fiscalize_request(payload, config, cert_pem, key_pem):
-    import glob
-    import tempfile
+class FinaHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections use a prebuilt SSLContext (client certificate and CA bundle in memory)."""
 
-    headers = {"Content-Type": "text/xml; charset=utf-8"}
+    def __init__(self, ssl_context, **kwargs):
+        # Set before super().__init__(), which calls init_poolmanager()
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
 
-    # Combine CA certificates from the directory
-    ca_dir = os.environ.get("FINA_CA_DIR_PATH")
-    if not ca_dir:
-        raise ValueError("FINA_CA_DIR_PATH environment variable is required for SSL verification")
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = self.ssl_context
+        return super().init_poolmanager(*args, **kwargs)
 
-    ca_pem_files = glob.glob(os.path.join(ca_dir, "*.pem"))
+    def cert_verify(self, conn, url, verify, cert):
+        # Trust comes only from the FINA CA bundle in the SSLContext - don't let requests add certifi's
+        conn.cert_reqs = "CERT_REQUIRED"
+
+
+@functools.lru_cache(maxsize=1)
+def load_ca_bundle(ca_dir):
+    """Glob, read and combine the CA certificates in ca_dir once; the result is reused for every session."""
+    ca_pem_files = sorted(glob.glob(os.path.join(ca_dir, "*.pem")))
     if not ca_pem_files:
         raise ValueError(f"No .pem files found in {ca_dir}")
 
-    # Read and combine all CA certificates
     combined_ca = b""
-    for ca_file in sorted(ca_pem_files):
+    for ca_file in ca_pem_files:
         with open(ca_file, "rb") as f:
             combined_ca += f.read()
             combined_ca += b"\n"  # Ensure separation between certificates
 
     logger.info(f"Loaded {len(ca_pem_files)} CA certificate(s) from {ca_dir}")
+    return combined_ca
+
 
-    # Use in-memory temporary files that are automatically cleaned up
-    with tempfile.NamedTemporaryFile(mode="wb", suffix=".pem") as cert_file, tempfile.NamedTemporaryFile(
-        mode="wb", suffix=".pem"
-    ) as key_file, tempfile.NamedTemporaryFile(mode="wb", suffix=".pem") as ca_bundle_file:
-        cert_file.write(cert_pem)
-        key_file.write(key_pem)
-        ca_bundle_file.write(combined_ca)
+@functools.lru_cache(maxsize=2)
+def get_fina_session(cert_pem, key_pem, ca_dir):
+    """
+    Return a requests.Session for FINA, built once per certificate and CA directory.
+
+    The SSLContext is created once, so there are no per-request temp files or CA reads,
+    and the session keeps the TLS connection to FINA alive between fiscalizations.
+    """
+    ssl_context = ssl.create_default_context(cadata=load_ca_bundle(ca_dir).decode())
+    # load_cert_chain() only accepts a path - the PEM is on disk for the duration of this call only
+    with tempfile.NamedTemporaryFile(mode="wb", suffix=".pem") as cert_file:
+        cert_file.write(cert_pem + key_pem)
         cert_file.flush()
-        key_file.flush()
-        ca_bundle_file.flush()
-
-        r = requests.post(
-            config["fina_endpoint"],
-            data=payload.encode(),
-            headers=headers,
-            cert=(cert_file.name, key_file.name),
-            verify=ca_bundle_file.name,
-        )
+        ssl_context.load_cert_chain(cert_file.name)
 
-        logger.info(f"📤 Sent to FINA: {r.status_code}")
-        return r.text
-        # Files are automatically deleted when exiting the 'with' block
+    session = requests.Session()
+    session.mount(
+        "https://",
+        FinaHTTPAdapter(ssl_context, pool_connections=FINA_POOL_CONNECTIONS, pool_maxsize=FINA_POOL_MAXSIZE),
+    )
+    return session
 
 
-def xml_to_yaml(xml_string: str):
-    try:
-        root = ET.fromstring(xml_string.encode("utf-8"))
+# A forked child must open its own connections rather than share the parent's sockets
+os.register_at_fork(after_in_child=get_fina_session.cache_clear)
 
-        def element_to_dict(elem):
-            children = list(elem)
-            if not children:
-                return elem.text
-            result = {}
-            for child in children:
-                tag = child.tag.split("}")[-1]
-                result[tag] = element_to_dict(child)
-            return result
 
-        root_tag = root.tag.split("}")[-1]
-        data = {root_tag: element_to_dict(root)}
+def fiscalize_request(payload, config, cert_pem, key_pem):
+    headers = {"Content-Type": "text/xml; charset=utf-8"}
+
+    ca_dir = config["ca_dir"]
+    if not ca_dir:
+        raise ValueError("FINA_CA_DIR_PATH environment variable is required for SSL verification")
+
+    session = get_fina_session(cert_pem, key_pem, ca_dir)
+    r = session.post(config["fina_endpoint"], data=payload.encode(), headers=headers)
+
+    logger.info(f"📤 Sent to FINA: {r.status_code}")
+    # Raw bytes - lxml decodes them once itself, per the XML declaration
+    return r.content
+
+
+def element_to_dict(root, drop_signatures=False):
+    """
+    Convert an element to nested dicts keyed by local tag name; leaf elements map to their text.
+
+    Walks the tree iteratively with lxml iterwalk (no Python recursion per node).
+    With drop_signatures, Signature subtrees and empty leaf elements are left out.
+    """
+    stack = [{}]
+    walker = ET.iterwalk(root, events=("start", "end"))
+    for event, elem in walker:
+        if event == "start":
+            if drop_signatures and elem.tag.endswith("Signature"):
+                walker.skip_subtree()
+            stack.append({})
+            continue
+
+        children = stack.pop()
+        if drop_signatures and elem.tag.endswith("Signature"):
+            value = None
+        else:
+            value = children if len(elem) else elem.text
+        # With drop_signatures, None values (Signature subtrees, empty leaves) are dropped - except for the root
+        if value is not None or not drop_signatures or len(stack) == 1:
+            stack[-1][ET.QName(elem).localname] = value
+
+    return stack[0][ET.QName(root).localname]
+
+
+def _yaml_scalar(value):
+    """Render str/None as SafeDumper would; None means the value needs PyYAML's escaping."""
+    if value is None:
+        return "null"
+    if (
+        _YAML_PLAIN_SCALAR.fullmatch(value)
+        and _YAML_RESOLVER.resolve(yaml.ScalarNode, value, (True, False))
+        == yaml.resolver.BaseResolver.DEFAULT_SCALAR_TAG
+    ):
+        return value
+    if _YAML_SINGLE_QUOTABLE.fullmatch(value):
+        return "'" + value.replace("'", "''") + "'"
+    return None
 
-        return yaml.dump(data, allow_unicode=True)
+
+def dump_audit_yaml(data, sort_keys=True):
+    """
+    Write the nested dicts from element_to_dict() as block-style YAML without the PyYAML emitter.
+
+    Audit files are never parsed back by the app, and the data is only str/None leaves under
+    tag-name keys, so lines are written directly. The output loads back to the same data but
+    is not byte-identical to yaml.dump: only simple word-like values stay plain, so text with
+    spaces or '/' is single-quoted where yaml.dump leaves it bare, and long quoted text is not
+    folded at 80 columns. Values with line breaks or control characters fall back to yaml.dump.
+    """
+    lines = []
+    stack = [iter(sorted(data.items()) if sort_keys else data.items())]
+    while stack:
+        indent = "  " * (len(stack) - 1)
+        for key, value in stack[-1]:
+            key = _yaml_scalar(key)
+            nested = isinstance(value, dict) and value
+            scalar = None if nested else "{}" if isinstance(value, dict) else _yaml_scalar(value)
+            if key is None or not nested and scalar is None:
+                return yaml.dump(
+                    data, Dumper=YAML_DUMPER, allow_unicode=True, default_flow_style=False, sort_keys=sort_keys
+                )
+            if nested:
+                lines.append(f"{indent}{key}:")
+                stack.append(iter(sorted(value.items()) if sort_keys else value.items()))
+                break
+            lines.append(f"{indent}{key}: {scalar}")
+        else:
+            stack.pop()
+
+    return "\n".join(lines) + "\n"
+
+
+def xml_to_yaml(root):
+    try:
+        data = {ET.QName(root).localname: element_to_dict(root)}
+
+        return dump_audit_yaml(data)
 
     except Exception as e:
         logger.error(f"❌ Failed to convert XML to YAML: {e}")
 
 
-def soap_response_to_yaml(xml_string):
-    root = ET.fromstring(xml_string.encode("utf-8"))
-    body = root.find(".//{http://schemas.xmlsoap.org/soap/envelope/}Body")
-    if body is None or not list(body):
-        raise ValueError("No SOAP Body found or it is empty")
+def build_audit_tarball(files):
+    """
+    Pack (content, filename) text files into an uncompressed in-memory tar archive.
+
+    Returns:
+        bytes: The tar archive
+    """
+    buffer = io.BytesIO()
+    mtime = time.time()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for content, filename in files:
+            data = content.encode("utf-8")
+            info = tarfile.TarInfo(filename)
+            info.size = len(data)
+            info.mtime = mtime
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
 
-    main_node = list(body)[0]
 
-    def element_to_dict(elem):
-        if elem.tag.endswith("Signature"):
-            return None
-        children = list(elem)
-        if not children:
-            return elem.text
-        return {
-            child.tag.split("}")[-1]: element_to_dict(child) for child in children if element_to_dict(child) is not None
-        }
+# Shared parser for untrusted FINA responses, configured once: no entity expansion (XXE) and no network
+# access. lxml serialises concurrent use of one parser with an internal lock, so threads can share it.
+XML_PARSER = ET.XMLParser(resolve_entities=False, no_network=True, huge_tree=False)
 
-    data = {main_node.tag.split("}")[-1]: element_to_dict(main_node)}
+# Compiled once; the search and tag match run inside libxml2 instead of a Python loop over every element
+JIR_XPATH = ET.XPath("string(.//*[local-name()='Jir'])", smart_strings=False)
 
-    return yaml.dump(data, allow_unicode=True, default_flow_style=False, sort_keys=False)
 
+def parse_response(xml_bytes):
+    """
+    Parse the FINA SOAP response (raw bytes) once and extract the JIR from it.
 
-def extract_jir(xml_string):
-    root = ET.fromstring(xml_string.encode("utf-8"))
+    Returns:
+        tuple: (jir, body) - jir is None if the response has no Jir element, body is the
+            parsed SOAP Body for soap_body_to_yaml(), or None if it is missing or empty
+    """
+    root = ET.fromstring(xml_bytes, XML_PARSER)
     body = root.find(".//{http://schemas.xmlsoap.org/soap/envelope/}Body")
-    if body is not None:
-        for el in body.iter():
-            if el.tag.endswith("Jir"):
-                return el.text
-    return None
+    if body is None or not len(body):
+        return None, None
+
+    return JIR_XPATH(body) or None, body
+
+
+def soap_body_to_yaml(body):
+    """Audit YAML of a SOAP Body already parsed by parse_response()."""
+    main_node = body[0]
+    data = {ET.QName(main_node).localname: element_to_dict(main_node, drop_signatures=True)}
+    return dump_audit_yaml(data, sort_keys=False)
 
 
 def fiscalize(payment_time, payment_amount, receipt_number, shared_folder_path) -> dict:
@@ -417,8 +687,7 @@ def fiscalize(payment_time, payment_amount, receipt_number, shared_folder_path)
     payment_time_zki = payment_time.strftime("%Y%m%d_%H%M%S")
 
     # Get current time for request timestamp (Zaglavlje)
-    fina_timezone = ZoneInfo(os.environ["FINA_TIMEZONE"])
-    request_time = datetime.now(fina_timezone)
+    request_time = datetime.now(config["fina_timezone"])
     request_time_xml = request_time.strftime("%d.%m.%YT%H:%M:%S")
 
     try:
@@ -443,7 +712,8 @@ def fiscalize(payment_time, payment_amount, receipt_number, shared_folder_path)
         logger.error(f"Failed to generate ZKI: {e}")
         raise ValueError(f"ZKI generation failed: {e}")
 
-    request_id = str(uuid.uuid4())
+    request_id = str(uuid7())
+    # Stays random: the first 15 hex digits of a UUIDv7 are almost all timestamp
     signature_node_id = f"G{uuid.uuid4().hex[:15]}"
 
     try:
@@ -457,6 +727,8 @@ def fiscalize(payment_time, payment_amount, receipt_number, shared_folder_path)
             receipt_number,
             config,
         )
+        # Convert before signing - sign_with_cert appends the Signature to the same tree
+        receipt_yaml = xml_to_yaml(receipt_content)
         receipt_signed = sign_with_cert(receipt_content, cert_pem, key_pem, signature_node_id)
         receipt = wrap_soap(receipt_signed)
         logger.info("Receipt built and signed successfully")
@@ -471,21 +743,45 @@ def fiscalize(payment_time, payment_amount, receipt_number, shared_folder_path)
         logger.error(f"FINA request failed: {e}")
         raise ValueError(f"FINA communication failed: {e}")
 
-    # Extract JIR before saving files
-    jir = extract_jir(response)
+    # Extract JIR before saving files; the audit YAML reuses the parsed Body inside the S3 block,
+    # so a failure while building it can't cost a JIR FINA already issued
+    jir, response_body = parse_response(response)
 
     # Save fiscal receipt files to S3 - supplementary audit trail
     # NOTE: S3 storage is NOT critical. JIR and ZKI in database are sufficient for compliance.
     # S3 failures should NOT fail the fiscalization process - log only.
     logger.info(f"Saving fiscal receipt files to S3: {shared_folder_path}")
     try:
-        s3_results = []
-        s3_results.append(save_file_to_s3(receipt, f"{shared_folder_path}/{FILE_REQUEST}.xml"))
-        s3_results.append(save_file_to_s3(xml_to_yaml(receipt_content), f"{shared_folder_path}/{FILE_REQUEST}.yaml"))
-        s3_results.append(save_file_to_s3(response, f"{shared_folder_path}/{FILE_RESPONSE}.xml"))
-        s3_results.append(
-            save_file_to_s3(soap_response_to_yaml(response), f"{shared_folder_path}/{FILE_RESPONSE}.yaml")
-        )
+        # The request and the raw response are always kept; a YAML copy that couldn't be built
+        # (malformed response, conversion error) is the only file skipped
+        response_yaml = None
+        if response_body is None:
+            logger.warning(f"No SOAP Body found or it is empty - {FILE_RESPONSE}.yaml not saved")
+        else:
+            try:
+                response_yaml = soap_body_to_yaml(response_body)
+            except Exception as e:
+                logger.warning(f"Failed to convert FINA response to YAML: {e} - {FILE_RESPONSE}.yaml not saved")
+
+        audit_files = [
+            (content, filename)
+            for content, filename in [
+                (receipt, f"{FILE_REQUEST}.xml"),
+                (receipt_yaml, f"{FILE_REQUEST}.yaml"),
+                (response.decode("utf-8", errors="replace"), f"{FILE_RESPONSE}.xml"),
+                (response_yaml, f"{FILE_RESPONSE}.yaml"),
+            ]
+            if content is not None
+        ]
+        if FINA_S3_AUDIT_TARBALL:
+            s3_results = [
+                save_binary_file_to_s3(build_audit_tarball(audit_files), f"{shared_folder_path}/{FILE_AUDIT_TAR}")
+            ]
+        else:
+            # Upload the files concurrently - wall time is the slowest upload, not the sum
+            s3_results = save_files_to_s3(
+                [(content, f"{shared_folder_path}/{filename}") for content, filename in audit_files]
+            )
 
         if not all(s3_results):
             logger.warning("Some S3 file saves failed - supplementary audit files missing but fiscalization successful")
@@ -7,36 +7,116 @@ Usage:
     python fina_cli.py --create-receipt --amount 100.00 --payment-time "2025-01-15 10:30:00"
     python fina_cli.py --generate-pdf 1 --template template.md --font RobotoMonoNerdFont-Medium
     python fina_cli.py --generate-pending-pdfs --template template.md --font RobotoMonoNerdFont-Medium
+    python fina_cli.py --cleanup-stale --max-age-minutes 30
 """
 
 import argparse
-import io
+import functools
 import logging
 import os
+import re
+import struct
 import sys
-import tempfile
+import time
+import zlib
 from datetime import datetime
 from decimal import Decimal
 from zoneinfo import ZoneInfo
 
 import qrcode
-from fpdf import FPDF, FontFace
-from jinja2 import Template
+from fpdf import FPDF, FontFace, XPos, YPos
+from fpdf.image_parsing import preload_image
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, TemplateNotFound
 from markdown_it import MarkdownIt
-from psycopg2.extras import RealDictCursor
-
-from fina import fiscalize, get_db_connection, process_fina_fiscalization
-from s3_storage import save_binary_file_to_s3
+from psycopg2.extras import RealDictCursor, execute_batch
+
+from db import execute_prepared, get_db_connection
+from fina import (
+    claim_queued_receipts,
+    cleanup_stale_processing_records,
+    fiscalize,
+    get_config,
+    process_fina_fiscalization,
+    reserve_receipt_number,
+)
+from s3_storage import save_binary_file_to_s3, save_to_s3_in_background
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+# One environment for the whole run - templates are compiled once and cached, also across runs via bytecode cache
+JINJA_ENV = Environment(
+    loader=FileSystemLoader("templates"),
+    bytecode_cache=FileSystemBytecodeCache(),
+    auto_reload=False,
+    autoescape=False,
+)
+
+# Columns generate_pdf_for_receipt() and generate_pending_pdfs() fetch to render a receipt
+PDF_RECEIPT_COLUMNS = """id, year, location_id, register_id, receipt_number,
+                       order_id, stripe_id, amount, currency, zki, jir,
+                       payment_time, status, receipt_created, receipt_updated,
+                       s3_folder_path, pdf_status, pdf_created"""
+
+# Retry result updates, run as server-side prepared statements (see db.execute_prepared) so repeated
+# retries on a pooled connection skip parse/plan
+PREPARED_STATEMENTS = {
+    "complete_retried_fina_receipt": """
+        UPDATE fina_receipt
+        SET zki = $1, jir = $2, status = 'completed', receipt_updated = CURRENT_TIMESTAMP
+        WHERE id = $3
+    """,
+    "fail_retried_fina_receipt": """
+        UPDATE fina_receipt
+        SET zki = $1, status = 'failed', receipt_updated = CURRENT_TIMESTAMP
+        WHERE id = $2
+    """,
+}
+
+# Rows per statement group when writing pdf_status transitions with execute_batch
+PDF_STATUS_BATCH_SIZE = 100
+# Receipts rendered between pdf_status writes in --generate-pending-pdfs - bounds what a killed run
+# leaves stuck in 'processing'
+PDF_STATUS_FLUSH_EVERY = 10
+
+# Markdown parser with its rule chain set up once (the CLI is single-threaded, so one instance is shared)
+MARKDOWN = MarkdownIt("commonmark", {"breaks": True, "html": True}).enable("table")
+
+UTC = ZoneInfo("UTC")
+HOSTNAME = os.environ.get("HOSTNAME", "unknown")
+
+# Runs of characters that are not S3-safe in filenames (hyphens included, so runs collapse to one)
+FILENAME_UNSAFE_REGEX = re.compile(r"[^\w.]+")
+
+# Markers substituted into templates and replaced while laying out the PDF
+QR_CODE_MARKER = "<!--QR_CODE_PLACEHOLDER-->"
+VERIFICATION_LINK_MARKER = "<!--VERIFICATION_LINK_PLACEHOLDER-->"
+
+# Markdown syntax understood by --fast-layout
+MARKDOWN_HEADING_REGEX = re.compile(r"^(#{1,6})\s+(.*)$")
+MARKDOWN_LINK_REGEX = re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)")
+FAST_LAYOUT_HEADING_SIZES = {1: 16, 2: 14, 3: 12}
+
+
+@functools.cache
+def get_fina_timezone() -> ZoneInfo:
+    """FINA_TIMEZONE, read on first use (not at import) and reused for every receipt."""
+    return ZoneInfo(os.environ["FINA_TIMEZONE"])
+
+
+def folder_timestamp(moment: datetime) -> str:
+    """Format moment as the YYYY-MM-DD-HH-MM-SS S3 folder prefix (an f-string is cheaper than strftime)."""
+    return (
+        f"{moment.year:04d}-{moment.month:02d}-{moment.day:02d}-"
+        f"{moment.hour:02d}-{moment.minute:02d}-{moment.second:02d}"
+    )
+
 
 def retry_receipt(receipt_number: int) -> dict:
     """Retry fiscalization for a failed receipt."""
 
-    # Get receipt from database
-    with get_db_connection() as conn:
+    # Get receipt from database (a pooled checkout, not a new connection)
+    with get_db_connection(autocommit=True) as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
                 """
@@ -59,45 +139,39 @@ def retry_receipt(receipt_number: int) -> dict:
 
     # Use original payment time from database for fiscalization
     # payment_time from DB is stored with timezone info (UTC), convert to local timezone
-    fina_timezone = ZoneInfo(os.environ["FINA_TIMEZONE"])
+    fina_timezone = get_fina_timezone()
     payment_time_utc = receipt["payment_time"]
     payment_time_local = payment_time_utc.astimezone(fina_timezone)
 
     # Generate S3 folder path with current UTC time (consistent with normal flow)
-    now_utc = datetime.now(ZoneInfo("UTC"))
-    timestamp = now_utc.strftime("%Y-%m-%d-%H-%M-%S")
-    hostname = os.environ.get("HOSTNAME", "unknown")
+    now_utc = datetime.now(UTC)
+    timestamp = folder_timestamp(now_utc)
     pid = os.getpid()
     identifier = receipt["stripe_id"] or receipt["order_id"] or f"receipt-{receipt_number}"
-    shared_folder_path = f"{timestamp}-fina-retry-{identifier}-{hostname}-{pid}"
+    shared_folder_path = f"{timestamp}-fina-retry-{identifier}-{HOSTNAME}-{pid}"
 
     # Perform fiscalization with original payment time in local timezone
     result = fiscalize(payment_time_local, float(receipt["amount"]), receipt_number, shared_folder_path)
 
-    # Update database with results
-    with get_db_connection() as conn:
+    # Update database with results - the connection is not held during the FINA round trip above
+    with get_db_connection(autocommit=True) as conn:
         with conn.cursor() as cur:
             if result.get("JIR"):
-                cur.execute(
-                    """
-                    UPDATE fina_receipt
-                    SET zki = %s, jir = %s, status = 'completed', receipt_updated = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                    """,
+                execute_prepared(
+                    cur,
+                    "complete_retried_fina_receipt",
+                    PREPARED_STATEMENTS["complete_retried_fina_receipt"],
                     [result.get("ZKI"), result.get("JIR"), receipt["id"]],
                 )
                 status = "completed"
             else:
-                cur.execute(
-                    """
-                    UPDATE fina_receipt
-                    SET zki = %s, status = 'failed', receipt_updated = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                    """,
+                execute_prepared(
+                    cur,
+                    "fail_retried_fina_receipt",
+                    PREPARED_STATEMENTS["fail_retried_fina_receipt"],
                     [result.get("ZKI"), receipt["id"]],
                 )
                 status = "failed"
-            conn.commit()
 
     return {
         "receipt_number": receipt_number,
@@ -114,20 +188,25 @@ def create_receipt(
     payment_time: datetime,
     order_id: str | None = None,
     stripe_id: str | None = None,
+    enqueue: bool = False,
 ) -> dict:
-    """Create and fiscalize a new receipt manually."""
+    """
+    Create and fiscalize a new receipt manually.
+
+    With enqueue=True the receipt is only stored with status 'queued' and the call returns
+    without waiting for FINA; process_queued_receipts() fiscalizes it later.
+    """
 
     # FINA only accepts EUR
     currency = "eur"
 
     # Ensure payment_time has timezone info (assume FINA timezone if not provided)
+    fina_timezone = get_fina_timezone()
     if payment_time.tzinfo is None:
-        fina_timezone = ZoneInfo(os.environ["FINA_TIMEZONE"])
         payment_time = payment_time.replace(tzinfo=fina_timezone)
-        logger.info(f"Payment time had no timezone, assumed {os.environ['FINA_TIMEZONE']}: {payment_time}")
+        logger.info(f"Payment time had no timezone, assumed {fina_timezone.key}: {payment_time}")
 
     # Convert to FINA timezone if it's in a different timezone
-    fina_timezone = ZoneInfo(os.environ["FINA_TIMEZONE"])
     payment_time_local = payment_time.astimezone(fina_timezone)
 
     # Generate unique payment_id for manual creation
@@ -138,14 +217,38 @@ def create_receipt(
         logger.info(f"Generated manual payment ID: {stripe_id}")
 
     # Generate S3 folder path with current UTC time
-    now_utc = datetime.now(ZoneInfo("UTC"))
-    timestamp = now_utc.strftime("%Y-%m-%d-%H-%M-%S")
-    hostname = os.environ.get("HOSTNAME", "unknown")
+    now_utc = datetime.now(UTC)
+    timestamp = folder_timestamp(now_utc)
     pid = os.getpid()
-    shared_folder_path = f"{timestamp}-fina-manual-{stripe_id}-{hostname}-{pid}"
+    shared_folder_path = f"{timestamp}-fina-manual-{stripe_id}-{HOSTNAME}-{pid}"
 
     logger.info(f"Creating manual receipt: amount={amount} {currency}, payment_time={payment_time_local}")
 
+    if enqueue:
+        config = get_config()
+        receipt_number = reserve_receipt_number(
+            payment_time_local.year,
+            config["location_id"],
+            config["register_id"],
+            order_id,
+            stripe_id,
+            float(amount),
+            currency,
+            payment_time_local,
+            shared_folder_path,
+            status="queued",
+        )
+        logger.info(f"Receipt {receipt_number} queued for fiscalization")
+        return {
+            "success": True,
+            "receipt_number": receipt_number,
+            "status": "queued",
+            "amount": amount,
+            "currency": currency,
+            "stripe_id": stripe_id,
+            "order_id": order_id,
+        }
+
     # Use the same flow as webhook processing
     try:
         result = process_fina_fiscalization(
@@ -199,6 +302,55 @@ def create_receipt(
         raise
 
 
+def process_queued_receipts(limit: int = 100, max_attempts: int = 3) -> dict:
+    """
+    Fiscalize receipts queued with create_receipt(enqueue=True).
+
+    Claims up to limit queued receipts and fiscalizes them one by one, retrying each up to
+    max_attempts times with exponential backoff (2s, 4s, ...) so a brief FINA outage doesn't
+    use up every attempt at once. A receipt that still fails stays 'failed' and can be retried
+    later with --retry-receipt.
+    """
+    receipts = claim_queued_receipts(limit)
+
+    fina_timezone = get_fina_timezone()
+    completed = 0
+    failed = 0
+
+    for receipt in receipts:
+        receipt_number = receipt["receipt_number"]
+
+        for attempt in range(1, max_attempts + 1):
+            try:
+                result = process_fina_fiscalization(
+                    payment_id=receipt["stripe_id"],
+                    payment_time=receipt["payment_time"].astimezone(fina_timezone),
+                    payment_amount=float(receipt["amount"]),
+                    payment_currency=receipt["currency"],
+                    invoice_id=receipt["order_id"],
+                    shared_folder_path=receipt["s3_folder_path"],
+                    receipt_number=receipt_number,
+                )
+            except Exception as e:
+                logger.warning(f"Attempt {attempt}/{max_attempts} failed for receipt {receipt_number}: {e}")
+            else:
+                if result.get("JIR"):
+                    break
+                logger.warning(f"Attempt {attempt}/{max_attempts} for receipt {receipt_number} returned no JIR")
+
+            if attempt < max_attempts:
+                time.sleep(2**attempt)
+        else:
+            logger.error(f"Giving up on receipt {receipt_number} after {max_attempts} attempts")
+            failed += 1
+            continue
+
+        logger.info(f"✅ Queued receipt {receipt_number} fiscalized")
+        completed += 1
+
+    return {"completed": completed, "failed": failed, "total": len(receipts)}
+
+
 def sanitize_filename(text: str) -> str:
     """
     Sanitize text for use in filenames (S3-safe).
@@ -209,12 +361,8 @@ def sanitize_filename(text: str) -> str:
     Returns:
         Sanitized text safe for filenames
     """
-    import re
-
-    # Replace spaces and special characters with hyphens
-    sanitized = re.sub(r"[^\w\-.]", "-", text)
-    # Replace multiple hyphens with single hyphen
-    sanitized = re.sub(r"-+", "-", sanitized)
+    # Replace each run of spaces, special characters and hyphens with a single hyphen
+    sanitized = FILENAME_UNSAFE_REGEX.sub("-", text)
     # Remove leading/trailing hyphens
     sanitized = sanitized.strip("-")
     return sanitized
@@ -235,7 +383,7 @@ def generate_verification_url(jir: str, payment_time: datetime, amount: float) -
     # Format: https://porezna.gov.hr/rn?jir=<JIR>&datv=<YYYYMMDD_HHMM>&izn=<SUM>
     # Sum: euros + cents without dot (e.g., 11.22 → 1122)
     # Convert to FINA timezone for verification
-    fina_timezone = ZoneInfo(os.environ["FINA_TIMEZONE"])
+    fina_timezone = get_fina_timezone()
     payment_time_local = payment_time.astimezone(fina_timezone)
     date_str = payment_time_local.strftime("%Y%m%d_%H%M")
     amount_cents = int(amount * 100)  # Convert to cents
@@ -244,7 +392,44 @@ def generate_verification_url(jir: str, payment_time: datetime, amount: float) -
     return verification_url
 
 
-def generate_qr_code_image(verification_url: str) -> str:
+# Reused QR encoder (the CLI is single-threaded); reset with clear() before each receipt
+QR_ENCODER = qrcode.QRCode(
+    version=None,  # Smallest version that fits the URL (picked by make(fit=True))
+    error_correction=qrcode.constants.ERROR_CORRECT_L,  # Required: at least "L" level
+    border=4,  # Border in boxes (quiet zone) - 4 is standard minimum for QR codes
+)
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def encode_qr_png(matrix: list[list[bool]], box_size: int) -> bytes:
+    """
+    Encode a QR module matrix as a 1-bit grayscale PNG, each module box_size x box_size pixels.
+
+    Same image the qrcode PIL factory produces (mode "1", black on white), without building a PIL image.
+    """
+    size = len(matrix) * box_size
+    scanlines = []
+    for row in matrix:
+        # 0 = black, 1 = white; pad the scanline to whole bytes
+        bits = "".join(("0" if dark else "1") * box_size for dark in row)
+        bits += "0" * (-len(bits) % 8)
+        scanline = b"\x00" + int(bits, 2).to_bytes(len(bits) // 8, "big")  # filter type 0 (None)
+        scanlines.append(scanline * box_size)
+
+    return b"".join(
+        [
+            b"\x89PNG\r\n\x1a\n",
+            _png_chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 1, 0, 0, 0, 0)),
+            _png_chunk(b"IDAT", zlib.compress(b"".join(scanlines), 9)),
+            _png_chunk(b"IEND", b""),
+        ]
+    )
+
+
+def generate_qr_code_image(verification_url: str) -> bytes:
     """
     Generate QR code for verification URL according to Croatian tax authority requirements.
 
@@ -259,54 +444,232 @@ def generate_qr_code_image(verification_url: str) -> str:
         verification_url: Full verification URL
 
     Returns:
-        Path to temporary QR code image file
+        PNG image bytes
     """
-    qr = qrcode.QRCode(
-        version=2,  # Smallest version (21x21 modules)
-        error_correction=qrcode.constants.ERROR_CORRECT_L,  # Required: at least "L" level
-        border=4,  # Border in boxes (quiet zone) - 4 is standard minimum for QR codes
-    )
-    qr.add_data(verification_url)
-    qr.make(fit=True)  # Auto-adjust version if data doesn't fit
+    QR_ENCODER.clear()
+    QR_ENCODER.version = None  # clear() keeps the previous version - let fit pick the smallest again
+    QR_ENCODER.add_data(verification_url)
+    QR_ENCODER.make(fit=True)
+
+    # Encoded in memory - embedded in the HTML as a data URI, no temporary file
+    return encode_qr_png(QR_ENCODER.get_matrix(), QR_ENCODER.box_size)
+
+
+def load_template(template_name: str):
+    """Return the compiled Jinja2 template from templates/ (compiled once, then cached by JINJA_ENV)."""
+    try:
+        return JINJA_ENV.get_template(template_name)
+    except TemplateNotFound:
+        raise ValueError(f"Template '{template_name}' not found in templates/ directory")
+
+
+@functools.cache
+def get_font_path(font_name: str) -> str:
+    """Resolve and check fonts/<font_name>.ttf once per process."""
+    font_path = os.path.join("fonts", f"{font_name}.ttf")
+    if not os.path.exists(font_path):
+        raise ValueError(f"Font '{font_name}.ttf' not found in fonts/ directory")
+    return font_path
+
+
+@functools.cache
+def get_tag_styles(font_name: str) -> dict:
+    """Heading and code styles for write_html, built once per font (write_html copies, never mutates them)."""
+    return {
+        "h1": FontFace(family=font_name, size_pt=16),
+        "h2": FontFace(family=font_name, size_pt=14),
+        "h3": FontFace(family=font_name, size_pt=12),
+        "pre": FontFace(family=font_name, size_pt=9),
+        "code": FontFace(family=font_name, size_pt=9),
+    }
 
-    img = qr.make_image(fill_color="black", back_color="white")
 
-    # Save to temporary file
-    with tempfile.NamedTemporaryFile(mode="wb", suffix=".png", delete=False) as tmp_file:
-        img.save(tmp_file, format="PNG")
-        return tmp_file.name
+class ReceiptPDF(FPDF):
+    """Single-page receipt document with the custom font registered and selected."""
 
+    def __init__(self, font_name: str):
+        super().__init__()
+        self.add_page()
+        self.set_auto_page_break(auto=True, margin=15)
 
-def generate_pdf_for_receipt(receipt_id: int, template_name: str, font_name: str) -> dict:
+        # Add and set custom font
+        self.add_font(font_name, style="", fname=get_font_path(font_name))
+        self.set_font(font_name, size=10)
+
+
+def layout_receipt_fast(pdf: FPDF, text: str, qr_code_png: bytes, qr_size_mm: float, verification_url: str):
     """
-    Generate PDF receipt for a specific receipt ID with Jinja2 templating.
+    Lay out a rendered Markdown receipt template with direct fpdf2 calls instead of write_html.
+
+    Handles the subset receipt templates use, line by line: '#' headings, fenced code blocks,
+    [text](url) links, <br> and blank lines, plus the QR code and verification link markers on
+    their own lines. Anything else (emphasis, list numbering, tables) is written as plain text.
+    """
+    in_code_block = False
+    for line in text.splitlines():
+        stripped = line.strip()
+
+        if stripped.startswith("```"):
+            in_code_block = not in_code_block
+            pdf.set_font_size(9 if in_code_block else 10)
+            continue
+        if in_code_block:
+            # Code block lines keep their alignment padding; blank ones only advance a line
+            if stripped:
+                pdf.multi_cell(w=0, text=line, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            else:
+                pdf.ln(pdf.font_size)
+            continue
+
+        if stripped == QR_CODE_MARKER:
+            pdf.image(qr_code_png, w=qr_size_mm)
+        elif stripped == VERIFICATION_LINK_MARKER:
+            pdf.set_font_size(7)
+            pdf.multi_cell(w=0, text=verification_url, link=verification_url, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            pdf.set_font_size(10)
+        elif not stripped or stripped == "<br>":
+            pdf.ln(pdf.font_size)
+        elif heading := MARKDOWN_HEADING_REGEX.match(stripped):
+            pdf.set_font_size(FAST_LAYOUT_HEADING_SIZES.get(len(heading.group(1)), 12))
+            pdf.ln(pdf.font_size / 2)
+            pdf.multi_cell(w=0, text=heading.group(2), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            pdf.set_font_size(10)
+        else:
+            # Plain text, with [text](url) links written as clickable text
+            position = 0
+            for link in MARKDOWN_LINK_REGEX.finditer(stripped):
+                pdf.write(text=stripped[position : link.start()])
+                pdf.write(text=link.group(1), link=link.group(2))
+                position = link.end()
+            pdf.write(text=stripped[position:])
+            pdf.ln()
+
+
+def receipt_pdf_s3_path(receipt: dict) -> str:
+    """S3 path of a receipt PDF, with the sanitized order_id in the filename."""
+    order_id_safe = sanitize_filename(receipt["order_id"]) if receipt["order_id"] else "no-order-id"
+    pdf_filename = f"fina-receipt-{order_id_safe}.pdf"
+    return f"{receipt['s3_folder_path']}/{pdf_filename}"
+
+
+def build_receipt_pdf(
+    receipt: dict, template_name: str, font_name: str, fast_layout: bool = False
+) -> tuple[bytearray, str]:
+    """
+    Render the PDF for an already fetched receipt row without uploading it.
 
     Args:
-        receipt_id: Receipt ID from database
+        receipt: fina_receipt row (dict with PDF_RECEIPT_COLUMNS)
         template_name: Template filename (e.g., 'template.md')
         font_name: Font name without extension (e.g., 'RobotoMonoNerdFont-Medium')
+        fast_layout: Lay the Markdown template out with direct fpdf2 calls instead of write_html
 
     Returns:
-        Dictionary with generation results
+        Tuple of (PDF bytes, S3 path the PDF belongs at)
     """
-    # Get receipt data from database
-    with get_db_connection() as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT id, year, location_id, register_id, receipt_number,
-                       order_id, stripe_id, amount, currency, zki, jir,
-                       payment_time, status, receipt_created, receipt_updated,
-                       s3_folder_path, pdf_status, pdf_created
-                FROM fina_receipt
-                WHERE id = %s
-                """,
-                [receipt_id],
-            )
-            receipt = cur.fetchone()
+    # Generate verification URL
+    verification_url = generate_verification_url(receipt["jir"], receipt["payment_time"], float(receipt["amount"]))
+    logger.info(f"Verification URL: {verification_url}")
+
+    # Generate QR code with verification URL
+    qr_code_png = generate_qr_code_image(verification_url)
+    logger.info(f"Generated QR code ({len(qr_code_png)} bytes)")
+
+    # Load (and compile, on first use) the template
+    jinja_template = load_template(template_name)
+
+    # Prepare template data with special QR code placeholder
+    # Convert payment_time to Croatian timezone for display
+    fina_timezone = get_fina_timezone()
+    payment_time_local = receipt["payment_time"].astimezone(fina_timezone)
+
+    template_data = {
+        "receipt_number": (
+            f"{receipt['year']}/{receipt['location_id']}/" f"{receipt['register_id']}/{receipt['receipt_number']}"
+        ),
+        "order_id": receipt["order_id"] or "N/A",
+        "amount": f"{float(receipt['amount']):.2f}",
+        "register_id": receipt["register_id"],
+        "location_id": receipt["location_id"],
+        "payment_time": payment_time_local.strftime("%d.%m.%Y %H:%M:%S"),
+        "zki": receipt["zki"],
+        "jir": receipt["jir"],
+        "verification_link": f'<font size="7"><a href="{verification_url}">{verification_url}</a></font>',
+        "qr_code": QR_CODE_MARKER,  # Special marker for QR code insertion
+    }
+    if fast_layout:
+        template_data["verification_link"] = VERIFICATION_LINK_MARKER
+
+    # Render Jinja2 template
+    logger.info("Rendering Jinja2 template")
+    rendered_template = jinja_template.render(**template_data)
+
+    # QR code must be at least 2x2 cm (20mm) according to Croatian tax authority requirements
+    qr_size_mm = 20  # 2 cm = 20 mm (minimum required size)
+
+    if fast_layout:
+        logger.info("Generating PDF (fast layout)")
+        pdf = ReceiptPDF(font_name)
+        layout_receipt_fast(pdf, rendered_template, qr_code_png, qr_size_mm, verification_url)
+        return pdf.output(), receipt_pdf_s3_path(receipt)
+
+    # HTML templates are already what fpdf2 renders - only Markdown templates need converting per receipt
+    if template_name.endswith(".html"):
+        html_content = rendered_template
+    else:
+        logger.info("Converting markdown to HTML")
+        html_content = MARKDOWN.render(rendered_template)
+
+    # Create PDF
+    logger.info("Generating PDF")
+    pdf = ReceiptPDF(font_name)
+
+    # Replace QR code placeholder with actual image tag
+    # The PNG is registered in the document's image cache and referenced by its cache key, so fpdf2
+    # uses the bytes as they are instead of base64-encoding them into the HTML and decoding them again
+    # fpdf2 HTML rendering uses 96 DPI (Windows standard) not 72 DPI
+    # Conversion: 1 inch = 25.4 mm, so 1 mm = 96/25.4 ≈ 3.779528 pixels
+    # For 20mm: 20 * (96/25.4) ≈ 75.59 pixels
+    if QR_CODE_MARKER in html_content:
+        qr_code_src, _, _ = preload_image(pdf.image_cache, qr_code_png)
+        qr_size_pixels = int(qr_size_mm * 96 / 25.4)  # Convert mm to pixels at 96 DPI
+        qr_code_html = f'<img src="{qr_code_src}" width="{qr_size_pixels}" />'
+        html_content = html_content.replace(QR_CODE_MARKER, qr_code_html)
 
-    if not receipt:
-        raise ValueError(f"Receipt ID {receipt_id} not found")
+    # Render HTML with custom font (QR code is already in HTML)
+    pdf.write_html(html_content, font_family=font_name, tag_styles=get_tag_styles(font_name))
+
+    # fpdf2 returns a bytearray, which boto3 uploads as is - no bytes()/BytesIO copy of the document
+    return pdf.output(), receipt_pdf_s3_path(receipt)
+
+
+def render_receipt_pdf(receipt: dict, template_name: str, font_name: str, fast_layout: bool = False) -> str:
+    """
+    Render the PDF for an already fetched receipt row and upload it to S3.
+
+    Args:
+        receipt: fina_receipt row (dict with PDF_RECEIPT_COLUMNS)
+        template_name: Template filename (e.g., 'template.md')
+        font_name: Font name without extension (e.g., 'RobotoMonoNerdFont-Medium')
+        fast_layout: Lay the Markdown template out with direct fpdf2 calls instead of write_html
+
+    Returns:
+        S3 path of the uploaded PDF
+
+    Raises:
+        ValueError: If the S3 upload failed
+    """
+    pdf_bytes, s3_path = build_receipt_pdf(receipt, template_name, font_name, fast_layout)
+    logger.info(f"Uploading PDF to S3: {s3_path}")
+    if not save_binary_file_to_s3(pdf_bytes, s3_path):
+        raise ValueError(f"Failed to upload PDF to S3: {s3_path}")
+
+    return s3_path
+
+
+def validate_receipt_for_pdf(receipt: dict) -> None:
+    """Raise ValueError if a PDF cannot be generated for the receipt row."""
+    receipt_id = receipt["id"]
 
     if receipt["status"] != "completed":
         raise ValueError(f"Receipt {receipt_id} status is '{receipt['status']}', must be 'completed' to generate PDF")
@@ -317,121 +680,61 @@ def generate_pdf_for_receipt(receipt_id: int, template_name: str, font_name: str
     if not receipt["s3_folder_path"]:
         raise ValueError(f"Receipt {receipt_id} has no S3 folder path, cannot upload PDF")
 
-    logger.info(f"Generating PDF for receipt {receipt_id} (receipt_number: {receipt['receipt_number']})")
 
-    # Mark as processing
-    with get_db_connection() as conn:
-        with conn.cursor() as cur:
+def generate_pdf_for_receipt(
+    receipt_id: int, template_name: str, font_name: str, fast_layout: bool = False, mark_processing: bool = False
+) -> dict:
+    """
+    Generate PDF receipt for a specific receipt ID with Jinja2 templating.
+
+    Args:
+        receipt_id: Receipt ID from database
+        template_name: Template filename (e.g., 'template.md')
+        font_name: Font name without extension (e.g., 'RobotoMonoNerdFont-Medium')
+        fast_layout: Lay the Markdown template out with direct fpdf2 calls instead of write_html
+        mark_processing: Set pdf_status to 'processing' while rendering, so other workers can see it.
+            Off by default - the CLI renders one receipt at a time and only the final status matters.
+
+    Returns:
+        Dictionary with generation results
+    """
+    # Get receipt data from database
+    with get_db_connection(autocommit=True) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
-                """
-                UPDATE fina_receipt
-                SET pdf_status = 'processing'
+                f"""
+                SELECT {PDF_RECEIPT_COLUMNS}
+                FROM fina_receipt
                 WHERE id = %s
                 """,
                 [receipt_id],
             )
-            conn.commit()
-
-    qr_code_path = None
-
-    try:
-        # Generate verification URL
-        verification_url = generate_verification_url(receipt["jir"], receipt["payment_time"], float(receipt["amount"]))
-        logger.info(f"Verification URL: {verification_url}")
-
-        # Generate QR code with verification URL
-        qr_code_path = generate_qr_code_image(verification_url)
-        logger.info(f"Generated QR code: {qr_code_path}")
-
-        # Read template file
-        template_path = os.path.join("templates", template_name)
-        if not os.path.exists(template_path):
-            raise ValueError(f"Template '{template_name}' not found in templates/ directory")
-
-        with open(template_path, "r", encoding="utf-8") as f:
-            template_content = f.read()
-
-        # Prepare template data with special QR code placeholder
-        # Convert payment_time to Croatian timezone for display
-        fina_timezone = ZoneInfo(os.environ["FINA_TIMEZONE"])
-        payment_time_local = receipt["payment_time"].astimezone(fina_timezone)
-
-        template_data = {
-            "receipt_number": (
-                f"{receipt['year']}/{receipt['location_id']}/" f"{receipt['register_id']}/{receipt['receipt_number']}"
-            ),
-            "order_id": receipt["order_id"] or "N/A",
-            "amount": f"{float(receipt['amount']):.2f}",
-            "register_id": receipt["register_id"],
-            "location_id": receipt["location_id"],
-            "payment_time": payment_time_local.strftime("%d.%m.%Y %H:%M:%S"),
-            "zki": receipt["zki"],
-            "jir": receipt["jir"],
-            "verification_link": f'<font size="7"><a href="{verification_url}">{verification_url}</a></font>',
-            "qr_code": "<!--QR_CODE_PLACEHOLDER-->",  # Special marker for QR code insertion
-        }
-
-        # Render Jinja2 template
-        logger.info("Rendering Jinja2 template")
-        jinja_template = Template(template_content)
-        rendered_markdown = jinja_template.render(**template_data)
+            receipt = cur.fetchone()
 
-        # Convert markdown to HTML
-        logger.info("Converting markdown to HTML")
-        md = MarkdownIt("commonmark", {"breaks": True, "html": True}).enable("table")
-        html_content = md.render(rendered_markdown)
-
-        # Replace QR code placeholder with actual image tag
-        # QR code must be at least 2x2 cm (20mm) according to Croatian tax authority requirements
-        # fpdf2 HTML rendering uses 96 DPI (Windows standard) not 72 DPI
-        # Conversion: 1 inch = 25.4 mm, so 1 mm = 96/25.4 ≈ 3.779528 pixels
-        # For 20mm: 20 * (96/25.4) ≈ 75.59 pixels
-        qr_size_mm = 20  # 2 cm = 20 mm (minimum required size)
-        qr_size_pixels = int(qr_size_mm * 96 / 25.4)  # Convert mm to pixels at 96 DPI
-        qr_code_html = f'<img src="{qr_code_path}" width="{qr_size_pixels}" />'
-        html_content = html_content.replace("<!--QR_CODE_PLACEHOLDER-->", qr_code_html)
+    if not receipt:
+        raise ValueError(f"Receipt ID {receipt_id} not found")
 
-        # Create PDF
-        logger.info("Generating PDF")
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=15)
+    validate_receipt_for_pdf(receipt)
 
-        # Add and set custom font
-        font_path = os.path.join("fonts", f"{font_name}.ttf")
-        if not os.path.exists(font_path):
-            raise ValueError(f"Font '{font_name}.ttf' not found in fonts/ directory")
-
-        logger.info(f"Adding custom font: {font_path}")
-        pdf.add_font(font_name, style="", fname=font_path)
-        pdf.set_font(font_name, size=10)
-
-        # Render HTML with custom font (QR code is already in HTML)
-        pdf.write_html(
-            html_content,
-            font_family=font_name,
-            tag_styles={
-                "h1": FontFace(family=font_name, size_pt=16),
-                "h2": FontFace(family=font_name, size_pt=14),
-                "h3": FontFace(family=font_name, size_pt=12),
-                "pre": FontFace(family=font_name, size_pt=9),
-                "code": FontFace(family=font_name, size_pt=9),
-            },
-        )
+    logger.info(f"Generating PDF for receipt {receipt_id} (receipt_number: {receipt['receipt_number']})")
 
-        # Save to BytesIO for S3 upload
-        pdf_bytes = pdf.output()
-        pdf_buffer = io.BytesIO(pdf_bytes)
+    if mark_processing:
+        with get_db_connection(autocommit=True) as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE fina_receipt
+                    SET pdf_status = 'processing'
+                    WHERE id = %s
+                    """,
+                    [receipt_id],
+                )
 
-        # Upload to S3 with sanitized order_id in filename
-        order_id_safe = sanitize_filename(receipt["order_id"]) if receipt["order_id"] else "no-order-id"
-        pdf_filename = f"fina-receipt-{order_id_safe}.pdf"
-        s3_path = f"{receipt['s3_folder_path']}/{pdf_filename}"
-        logger.info(f"Uploading PDF to S3: {s3_path}")
-        save_binary_file_to_s3(pdf_buffer.getvalue(), s3_path)
+    try:
+        s3_path = render_receipt_pdf(receipt, template_name, font_name, fast_layout)
 
         # Update database - mark as completed
-        with get_db_connection() as conn:
+        with get_db_connection(autocommit=True) as conn:
             with conn.cursor() as cur:
                 cur.execute(
                     """
@@ -441,7 +744,6 @@ def generate_pdf_for_receipt(receipt_id: int, template_name: str, font_name: str
                     """,
                     [receipt_id],
                 )
-                conn.commit()
 
         logger.info(f"✅ PDF generated successfully for receipt {receipt_id}")
         return {
@@ -454,7 +756,7 @@ def generate_pdf_for_receipt(receipt_id: int, template_name: str, font_name: str
     except Exception as e:
         # Mark as failed
         logger.error(f"PDF generation failed for receipt {receipt_id}: {e}")
-        with get_db_connection() as conn:
+        with get_db_connection(autocommit=True) as conn:
             with conn.cursor() as cur:
                 cur.execute(
                     """
@@ -464,60 +766,164 @@ def generate_pdf_for_receipt(receipt_id: int, template_name: str, font_name: str
                     """,
                     [receipt_id],
                 )
-                conn.commit()
         raise
-    finally:
-        # Clean up temporary QR code file
-        if qr_code_path and os.path.exists(qr_code_path):
-            try:
-                os.unlink(qr_code_path)
-            except Exception as e:
-                logger.warning(f"Failed to delete temporary QR code file: {e}")
 
 
-def generate_pending_pdfs(template_name: str, font_name: str, limit: int = 100) -> dict:
+def record_pdf_results(conn, uploads: list, failed_ids: list) -> tuple[list, list]:
+    """
+    Wait for queued PDF uploads and write the final pdf_status of their receipts.
+
+    Args:
+        conn: Autocommit connection the batched UPDATEs run on
+        uploads: (receipt_id, Future) pairs from save_to_s3_in_background
+        failed_ids: Receipt ids whose PDF could not be rendered
+
+    Returns:
+        Tuple of (completed_ids, failed_ids)
+    """
+    completed_ids = []
+    failed_ids = list(failed_ids)
+
+    # A receipt is only completed once its PDF is in S3
+    for receipt_id, future in uploads:
+        try:
+            uploaded = future.result()
+        except Exception as e:
+            logger.error(f"Failed to upload PDF for receipt {receipt_id}: {e}")
+            uploaded = False
+        if uploaded:
+            completed_ids.append(receipt_id)
+            logger.info(f"✅ PDF generated successfully for receipt {receipt_id}")
+        else:
+            failed_ids.append(receipt_id)
+
+    with conn.cursor() as cur:
+        execute_batch(
+            cur,
+            "UPDATE fina_receipt SET pdf_status = 'completed', pdf_created = CURRENT_TIMESTAMP WHERE id = %s",
+            [(receipt_id,) for receipt_id in completed_ids],
+            page_size=PDF_STATUS_BATCH_SIZE,
+        )
+        execute_batch(
+            cur,
+            "UPDATE fina_receipt SET pdf_status = 'failed' WHERE id = %s",
+            [(receipt_id,) for receipt_id in failed_ids],
+            page_size=PDF_STATUS_BATCH_SIZE,
+        )
+
+    return completed_ids, failed_ids
+
+
+def generate_pending_pdfs(template_name: str, font_name: str, limit: int = 100, fast_layout: bool = False) -> dict:
     """
     Batch process pending PDF receipts.
 
+    Receipts are claimed with one UPDATE ... FOR UPDATE SKIP LOCKED (so concurrent runs never
+    claim the same rows) and their final pdf_status is written with batched UPDATEs every
+    PDF_STATUS_FLUSH_EVERY receipts, so a killed run leaves at most that many rows in 'processing'.
+    PDFs are rendered one after another while their S3 uploads run concurrently on the upload pool.
+
     Args:
         template_name: Template filename (e.g., 'template.md')
         font_name: Font name without extension (e.g., 'RobotoMonoNerdFont-Medium')
         limit: Maximum number of receipts to process in one batch
+        fast_layout: Lay the Markdown template out with direct fpdf2 calls instead of write_html
 
     Returns:
         Dictionary with batch processing results
     """
-    # Get pending receipts
-    with get_db_connection() as conn:
+    # Check template and font once up front - a bad --template/--font aborts before any receipt is claimed
+    load_template(template_name)
+    get_font_path(font_name)
+
+    # One connection for the whole batch
+    with get_db_connection(autocommit=True) as conn:
+        # Claim pending receipts with every column needed to render them
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
-                """
-                SELECT id, receipt_number
-                FROM fina_receipt
-                WHERE pdf_status = 'pending' AND status = 'completed'
-                ORDER BY id ASC
-                LIMIT %s
+                f"""
+                UPDATE fina_receipt
+                SET pdf_status = 'processing'
+                WHERE id IN (
+                    SELECT id FROM fina_receipt
+                    WHERE pdf_status = 'pending' AND status = 'completed'
+                    ORDER BY id ASC
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING {PDF_RECEIPT_COLUMNS}
                 """,
                 [limit],
             )
-            pending_receipts = cur.fetchall()
+            pending_receipts = sorted(cur.fetchall(), key=lambda receipt: receipt["id"])
 
-    if not pending_receipts:
-        logger.info("No pending receipts to process")
-        return {"success": True, "processed": 0, "failed": 0, "total": 0}
+        if not pending_receipts:
+            logger.info("No pending receipts to process")
+            return {"success": True, "processed": 0, "failed": 0, "total": 0}
 
-    logger.info(f"Found {len(pending_receipts)} pending receipts to process")
+        logger.info(f"Found {len(pending_receipts)} pending receipts to process")
 
-    processed = 0
-    failed = 0
+        # Receipts that can't get a PDF (no JIR / S3 folder) go straight back to 'pending', as before
+        ready_receipts = []
+        failed = 0
+        for receipt in pending_receipts:
+            try:
+                validate_receipt_for_pdf(receipt)
+                ready_receipts.append(receipt)
+            except ValueError as e:
+                logger.error(f"Failed to generate PDF for receipt {receipt['id']}: {e}")
+                failed += 1
 
-    for receipt in pending_receipts:
+        ready_ids = {receipt["id"] for receipt in ready_receipts}
+        with conn.cursor() as cur:
+            execute_batch(
+                cur,
+                "UPDATE fina_receipt SET pdf_status = 'pending' WHERE id = %s",
+                [(receipt["id"],) for receipt in pending_receipts if receipt["id"] not in ready_ids],
+                page_size=PDF_STATUS_BATCH_SIZE,
+            )
+
+        processed = 0
+        finished_ids = set()
+        uploads = []
+        render_failed_ids = []
         try:
-            generate_pdf_for_receipt(receipt["id"], template_name, font_name)
-            processed += 1
-        except Exception as e:
-            logger.error(f"Failed to generate PDF for receipt {receipt['id']}: {e}")
-            failed += 1
+            # Rendering is CPU-bound and uses the shared QR encoder and Markdown parser, so it stays on
+            # this thread; uploads go to the S3 pool and overlap with rendering the next receipt
+            for receipt in ready_receipts:
+                logger.info(f"Generating PDF for receipt {receipt['id']} (receipt_number: {receipt['receipt_number']})")
+                try:
+                    pdf_bytes, s3_path = build_receipt_pdf(receipt, template_name, font_name, fast_layout)
+                    logger.info(f"Uploading PDF to S3: {s3_path}")
+                    uploads.append(
+                        (receipt["id"], save_to_s3_in_background(save_binary_file_to_s3, pdf_bytes, s3_path))
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to generate PDF for receipt {receipt['id']}: {e}")
+                    render_failed_ids.append(receipt["id"])
+
+                if len(uploads) + len(render_failed_ids) >= PDF_STATUS_FLUSH_EVERY:
+                    completed_ids, failed_ids = record_pdf_results(conn, uploads, render_failed_ids)
+                    processed += len(completed_ids)
+                    failed += len(failed_ids)
+                    finished_ids.update(completed_ids, failed_ids)
+                    uploads = []
+                    render_failed_ids = []
+        finally:
+            # Record outcomes even if the batch is interrupted
+            completed_ids, failed_ids = record_pdf_results(conn, uploads, render_failed_ids)
+            processed += len(completed_ids)
+            failed += len(failed_ids)
+            finished_ids.update(completed_ids, failed_ids)
+
+            # Receipts the interrupted loop never reached go back to 'pending' for the next run
+            with conn.cursor() as cur:
+                execute_batch(
+                    cur,
+                    "UPDATE fina_receipt SET pdf_status = 'pending' WHERE id = %s",
+                    [(receipt_id,) for receipt_id in ready_ids - finished_ids],
+                    page_size=PDF_STATUS_BATCH_SIZE,
+                )
 
     logger.info(f"Batch processing complete: {processed} successful, {failed} failed, {len(pending_receipts)} total")
 
@@ -548,6 +954,13 @@ Examples:
   # Create receipt with Stripe ID
   python fina_cli.py --create-receipt --amount 200.00 \\
       --stripe-id "pi_test123" --order-id "order_456"
+
+  # Queue a receipt and return immediately, then fiscalize the queue from a worker
+  python fina_cli.py --create-receipt --amount 100.00 --async
+  python fina_cli.py --process-queued
+
+  # Mark stale 'processing' receipts as failed (run from cron / a scheduler)
+  python fina_cli.py --cleanup-stale --max-age-minutes 30
         """,
     )
 
@@ -559,6 +972,8 @@ Examples:
     operation.add_argument(
         "--generate-pending-pdfs", action="store_true", help="Batch generate PDFs for all pending receipts"
     )
+    operation.add_argument("--process-queued", action="store_true", help="Fiscalize receipts queued with --async")
+    operation.add_argument("--cleanup-stale", action="store_true", help="Mark stale 'processing' receipts as failed")
 
     # Arguments for --create-receipt
     parser.add_argument("--amount", type=Decimal, help="Payment amount in EUR (required for --create-receipt)")
@@ -571,6 +986,12 @@ Examples:
     parser.add_argument(
         "--stripe-id", type=str, help="Stripe payment intent ID (optional, auto-generated if not provided)"
     )
+    parser.add_argument(
+        "--async",
+        dest="enqueue",
+        action="store_true",
+        help="Queue the receipt and return without waiting for FINA (fiscalized by --process-queued)",
+    )
 
     # Arguments for --generate-pdf and --generate-pending-pdfs
     parser.add_argument("--template", type=str, help="Template filename (e.g., 'template.md')")
@@ -579,6 +1000,19 @@ Examples:
         type=str,
         help="Font name without extension (e.g., 'RobotoMonoNerdFont-Medium' for Unicode support)",
     )
+    parser.add_argument(
+        "--fast-layout",
+        action="store_true",
+        help="Lay out Markdown templates with direct fpdf2 calls instead of the HTML renderer (faster)",
+    )
+
+    # Arguments for --cleanup-stale
+    parser.add_argument(
+        "--max-age-minutes",
+        type=int,
+        default=30,
+        help="Age after which 'processing' receipts are marked as failed (default: 30)",
+    )
 
     args = parser.parse_args()
 
@@ -610,7 +1044,7 @@ Examples:
                     parser.error('--payment-time must be in format "YYYY-MM-DD HH:MM:SS"')
             else:
                 # Use current time in FINA timezone
-                fina_timezone = ZoneInfo(os.environ["FINA_TIMEZONE"])
+                fina_timezone = get_fina_timezone()
                 payment_time = datetime.now(fina_timezone)
 
             result = create_receipt(
@@ -618,9 +1052,15 @@ Examples:
                 payment_time=payment_time,
                 order_id=args.order_id,
                 stripe_id=args.stripe_id,
+                enqueue=args.enqueue,
             )
 
-            if result["success"]:
+            if result["status"] == "queued":
+                print(f"✅ Receipt {result['receipt_number']} queued for fiscalization")
+                print(f"   Amount: {result['amount']} {result['currency']}")
+                print(f"   Payment ID: {result['stripe_id']}")
+                return 0
+            elif result["success"]:
                 print(f"✅ Receipt {result['receipt_number']} created successfully")
                 print(f"   Amount: {result['amount']} {result['currency']}")
                 print(f"   Payment ID: {result['stripe_id']}")
@@ -642,8 +1082,10 @@ Examples:
                 parser.error("--generate-pdf requires --template")
             if not args.font:
                 parser.error("--generate-pdf requires --font")
+            if args.fast_layout and args.template.endswith(".html"):
+                parser.error("--fast-layout requires a Markdown template")
 
-            result = generate_pdf_for_receipt(args.generate_pdf, args.template, args.font)
+            result = generate_pdf_for_receipt(args.generate_pdf, args.template, args.font, fast_layout=args.fast_layout)
             print(f"✅ PDF generated for receipt {result['receipt_number']}")
             print(f"   Receipt ID: {result['receipt_id']}")
             print(f"   S3 path: {result['s3_path']}")
@@ -655,14 +1097,29 @@ Examples:
                 parser.error("--generate-pending-pdfs requires --template")
             if not args.font:
                 parser.error("--generate-pending-pdfs requires --font")
+            if args.fast_layout and args.template.endswith(".html"):
+                parser.error("--fast-layout requires a Markdown template")
 
-            result = generate_pending_pdfs(args.template, args.font)
+            result = generate_pending_pdfs(args.template, args.font, fast_layout=args.fast_layout)
             print("✅ Batch processing complete:")
             print(f"   Processed: {result['processed']}")
             print(f"   Failed: {result['failed']}")
             print(f"   Total: {result['total']}")
             return 0
 
+        elif args.process_queued:
+            result = process_queued_receipts()
+            print("✅ Queue processing complete:")
+            print(f"   Completed: {result['completed']}")
+            print(f"   Failed: {result['failed']}")
+            print(f"   Total: {result['total']}")
+            return 0 if result["failed"] == 0 else 1
+
+        elif args.cleanup_stale:
+            cleaned_count = cleanup_stale_processing_records(max_age_minutes=args.max_age_minutes)
+            print(f"✅ Marked {cleaned_count} stale processing receipt(s) as failed")
+            return 0
+
     except Exception as e:
         logger.error(f"Error: {e}")
         print(f"❌ Error: {e}")
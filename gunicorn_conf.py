@@ -0,0 +1,24 @@
+"""
+Gunicorn configuration for the payment-hook Flask app.
+
+Usage:
+    gunicorn --config gunicorn_conf.py app:app
+"""
+
+import os
+
+bind = "0.0.0.0:8000"
+
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+# Threaded workers let health checks and concurrent webhooks run while a request waits on FINA
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 10
+
+# Import the app once in the master and fork workers from it (copy-on-write memory sharing).
+# The database pool, S3 upload pool and PID-based folder names are reset after fork in each worker.
+preload_app = True
+
+# Heartbeat files on tmpfs so worker liveness checks never block on disk I/O
+worker_tmp_dir = "/dev/shm"
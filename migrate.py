@@ -1,24 +1,57 @@
 #!/usr/bin/env python3
-import glob
+import atexit
 import logging
 import os
 import sys
+from contextlib import contextmanager
 from datetime import datetime
 
-import psycopg2
+from psycopg2.pool import SimpleConnectionPool
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+_pool = None
 
+
+def get_pool():
+    """
+    Return the migration connection pool, creating it on first use.
+
+    Migrations run one after another, so a single connection is opened and reused for the whole run
+    instead of connecting for every helper call. It deliberately does not use db.py's pool, whose
+    statement_timeout would cut long-running DDL short.
+    """
+    global _pool
+
+    if _pool is None:
+        _pool = SimpleConnectionPool(
+            1,
+            1,
+            host=os.getenv("PG_HOST", "localhost"),
+            port=os.getenv("PG_PORT", "5432"),
+            dbname=os.getenv("PG_DB"),
+            user=os.getenv("PG_USER"),
+            password=os.getenv("PG_PASSWORD"),
+        )
+        atexit.register(_pool.closeall)
+    return _pool
+
+
+@contextmanager
 def get_connection():
-    return psycopg2.connect(
-        host=os.getenv("PG_HOST", "localhost"),
-        port=os.getenv("PG_PORT", "5432"),
-        dbname=os.getenv("PG_DB"),
-        user=os.getenv("PG_USER"),
-        password=os.getenv("PG_PASSWORD"),
-    )
+    """Check out the pooled connection; commits on success, rolls back on error and always returns it."""
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
 
 
 def ensure_migrations_table():
@@ -46,22 +79,33 @@ def get_applied_migrations():
             return [row[0] for row in cur.fetchall()]
 
 
-def mark_migration_applied(version):
-    """Mark a migration as applied."""
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
-            conn.commit()
+def mark_migration_applied(cur, version):
+    """Mark a migration as applied, in the caller's transaction."""
+    cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
 
 
 def get_migration_files():
     """Get sorted list of migration files."""
-    migration_files = glob.glob("migrations/*.sql")
-    return sorted([os.path.basename(f) for f in migration_files])
+    # scandir yields names and file types from one directory read, no per-entry fnmatch or stat
+    # (hidden files are skipped, as glob did)
+    try:
+        with os.scandir("migrations") as entries:
+            return sorted(
+                entry.name
+                for entry in entries
+                if entry.name.endswith(".sql") and not entry.name.startswith(".") and entry.is_file()
+            )
+    except FileNotFoundError:
+        return []
+
 
+def migration_version(migration_file):
+    """Version of a migration file: its name without .sql (get_migration_files() only returns .sql files)."""
+    return migration_file[:-4]
 
-def run_migration(migration_file):
-    """Run a single migration file."""
+
+def run_migration(cur, migration_file):
+    """Run a single migration file and mark it applied, in the caller's transaction."""
     migration_path = os.path.join("migrations", migration_file)
 
     if not os.path.exists(migration_path):
@@ -76,17 +120,11 @@ def run_migration(migration_file):
             logger.warning(f"Empty migration file: {migration_file}")
             return True
 
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # Split by semicolons and execute each statement
-                statements = [s.strip() for s in sql.split(";") if s.strip()]
-                for statement in statements:
-                    cur.execute(statement)
-                conn.commit()
-
-        # Extract version from filename (remove .sql extension)
-        version = migration_file[:-4] if migration_file.endswith(".sql") else migration_file
-        mark_migration_applied(version)
+        # Send the whole file at once - Postgres runs multi-statement strings in order, in one
+        # round trip, and semicolons inside strings or function bodies are not split apart
+        cur.execute(sql)
+
+        mark_migration_applied(cur, migration_version(migration_file))
         logger.info(f"Applied migration: {migration_file}")
         return True
 
@@ -99,18 +137,14 @@ def run_migrations():
     """Run all pending migrations."""
     ensure_migrations_table()
 
-    applied_migrations = get_applied_migrations()
+    applied_migrations = set(get_applied_migrations())
     migration_files = get_migration_files()
 
     if not migration_files:
         logger.info("No migration files found")
         return True
 
-    pending_migrations = []
-    for migration_file in migration_files:
-        version = migration_file[:-4] if migration_file.endswith(".sql") else migration_file
-        if version not in applied_migrations:
-            pending_migrations.append(migration_file)
+    pending_migrations = [f for f in migration_files if migration_version(f) not in applied_migrations]
 
     if not pending_migrations:
         logger.info("No pending migrations")
@@ -118,10 +152,15 @@ def run_migrations():
 
     logger.info(f"Found {len(pending_migrations)} pending migrations")
 
-    for migration_file in pending_migrations:
-        if not run_migration(migration_file):
-            logger.error(f"Migration failed, stopping: {migration_file}")
-            return False
+    # One transaction for the whole run: a failing migration rolls back every migration of this run
+    # together with its schema_migrations row, so the database is never left half-migrated
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            for migration_file in pending_migrations:
+                if not run_migration(cur, migration_file):
+                    conn.rollback()
+                    logger.error(f"Migration failed, stopping (no migrations from this run applied): {migration_file}")
+                    return False
 
     logger.info("All migrations applied successfully")
     return True
@@ -189,11 +228,8 @@ def main():
             for migration in applied:
                 print(f"  ✓ {migration}")
 
-            pending = []
-            for migration_file in available:
-                version = migration_file[:-4] if migration_file.endswith(".sql") else migration_file
-                if version not in applied:
-                    pending.append(migration_file)
+            applied_versions = set(applied)
+            pending = [f for f in available if migration_version(f) not in applied_versions]
 
             if pending:
                 print(f"\nPending migrations ({len(pending)}):")
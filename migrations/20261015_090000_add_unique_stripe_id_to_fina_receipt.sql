@@ -0,0 +1,42 @@
+-- Migration: add_unique_stripe_id_to_fina_receipt
+-- Created: 2026-10-15T09:00:00
+-- Description:
+--   Make stripe_id unique so the webhook can reserve a receipt and detect duplicate
+--   deliveries with a single INSERT ... ON CONFLICT (stripe_id) DO NOTHING statement.
+--   NULL stripe_id values remain allowed (NULLs never conflict).
+--
+--   Older releases reserved receipts with check-then-insert, so a database may already hold
+--   several rows for one stripe_id. The precheck below aborts with the offending stripe_ids
+--   (and, since pending migrations run in one transaction, nothing from this run is applied).
+--   To clean up, for each listed stripe_id:
+--     SELECT id, receipt_number, status, jir FROM fina_receipt WHERE stripe_id = '<stripe_id>';
+--   keep the row FINA fiscalized (status 'completed', with a JIR), then set stripe_id to NULL
+--   on the other rows - they keep their receipt_number for the audit trail:
+--     UPDATE fina_receipt SET stripe_id = NULL WHERE stripe_id = '<stripe_id>' AND id <> <kept id>;
+--   and re-run migrate.py.
+
+DO $$
+DECLARE
+  duplicates TEXT;
+BEGIN
+  SELECT string_agg(format('%s (%s rows)', stripe_id, n), ', ' ORDER BY stripe_id)
+  INTO duplicates
+  FROM (
+    SELECT stripe_id, COUNT(*) AS n
+    FROM fina_receipt
+    WHERE stripe_id IS NOT NULL
+    GROUP BY stripe_id
+    HAVING COUNT(*) > 1
+  ) AS dup;
+
+  IF duplicates IS NOT NULL THEN
+    RAISE EXCEPTION 'Duplicate stripe_id values in fina_receipt: %', duplicates
+      USING HINT = 'Keep one row per stripe_id and set stripe_id to NULL on the others '
+                   || '(see the header of 20261015_090000_add_unique_stripe_id_to_fina_receipt.sql)';
+  END IF;
+END $$;
+
+-- Replace the plain index with a unique one
+DROP INDEX IF EXISTS idx_fina_receipt_stripe_id;
+
+CREATE UNIQUE INDEX idx_fina_receipt_stripe_id ON fina_receipt(stripe_id);
@@ -0,0 +1,10 @@
+-- Migration: add_processing_partial_index_to_fina_receipt
+-- Created: 2026-10-15T12:00:00
+-- Description:
+--   Partial index for cleanup_stale_processing_records(), which marks 'processing' rows
+--   whose receipt_updated is old as 'failed'. Only in-flight rows are indexed, so the periodic
+--   cleanup scan touches the few 'processing' rows instead of the whole table, and the index stays tiny.
+
+CREATE INDEX IF NOT EXISTS idx_fina_receipt_processing_updated
+  ON fina_receipt(receipt_updated)
+  WHERE status = 'processing';
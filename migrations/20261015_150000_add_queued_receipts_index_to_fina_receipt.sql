@@ -0,0 +1,10 @@
+-- Migration: add_queued_receipts_index_to_fina_receipt
+-- Created: 2026-10-15T15:00:00
+-- Description:
+--   Partial index over 'queued' rows for claim_queued_receipts() (fina_cli.py
+--   --create-receipt --async / --process-queued), so workers find the queue head without
+--   scanning the table.
+
+CREATE INDEX IF NOT EXISTS idx_fina_receipt_queued
+  ON fina_receipt(id)
+  WHERE status = 'queued';
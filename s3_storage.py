@@ -1,13 +1,67 @@
+import atexit
+import functools
 import logging
 import os
 import re
-from typing import Optional
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError, NoCredentialsError
 
 logger = logging.getLogger(__name__)
 
+S3_UPLOAD_ATTEMPTS = 3
+# Threads for uploads a caller waits on (save_files_to_s3), e.g. the four FINA audit files
+S3_SYNC_UPLOAD_WORKERS = 4
+
+# Allowed S3 key characters: alphanumeric, hyphens, underscores, slashes, dots
+S3_KEY_REGEX = re.compile(r"[a-zA-Z0-9/_.-]+")
+
+# Every validate_s3_key rule in one pass: allowed characters, no "..", no leading/trailing "/",
+# at most 1000 characters (the character set is ASCII, so that is also the UTF-8 byte length)
+VALID_S3_KEY_REGEX = re.compile(r"(?!/)(?!.*\.\.)[a-zA-Z0-9/_.-]{1,1000}(?<!/)")
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def _create_upload_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=int(os.environ.get("S3_UPLOAD_WORKERS", "8")),
+        thread_name_prefix="s3-upload",
+    )
+
+
+def _create_sync_upload_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=S3_SYNC_UPLOAD_WORKERS, thread_name_prefix="s3-sync-upload")
+
+
+def _reset_after_fork():
+    """Give each forked worker its own executors and S3 client - threads, queues and sockets do not survive fork."""
+    global _upload_executor, _sync_upload_executor, _s3_client, _s3_client_lock
+    _upload_executor = _create_upload_executor()
+    _sync_upload_executor = _create_sync_upload_executor()
+    _s3_client = None
+    _s3_client_lock = threading.Lock()
+
+
+def _shutdown_upload_executor():
+    """Drain queued uploads on interpreter shutdown so audit files are not lost."""
+    _upload_executor.shutdown(wait=True)
+
+
+# Background uploads keep S3 latency off the webhook critical path
+_upload_executor = _create_upload_executor()
+# Uploads a request thread waits on get their own pool, so they never queue behind background
+# retries sleeping between attempts
+_sync_upload_executor = _create_sync_upload_executor()
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(_shutdown_upload_executor)
+
 
 def validate_s3_key(s3_key: str) -> str:
     """
@@ -28,6 +82,10 @@ def validate_s3_key(s3_key: str) -> str:
     # Remove leading/trailing whitespace
     s3_key = s3_key.strip()
 
+    # Fast path for valid keys; the checks below only run to explain why a key is rejected
+    if VALID_S3_KEY_REGEX.fullmatch(s3_key):
+        return s3_key
+
     # Check for path traversal patterns
     if ".." in s3_key or s3_key.startswith("/") or s3_key.endswith("/"):
         raise ValueError("S3 key contains invalid path traversal patterns")
@@ -42,37 +100,49 @@ def validate_s3_key(s3_key: str) -> str:
         raise ValueError("S3 key is too long")
 
     # Validate format: should be alphanumeric, hyphens, underscores, slashes, dots
-    if not re.match(r"^[a-zA-Z0-9/_.-]+$", s3_key):
+    if not S3_KEY_REGEX.fullmatch(s3_key):
         raise ValueError("S3 key contains unsupported characters")
 
     return s3_key
 
 
 def get_s3_client():
-    """Create and return S3 client with Hetzner Object Storage configuration"""
-    return boto3.client(
-        "s3",
-        aws_access_key_id=os.environ["S3_ACCESS_KEY"],
-        aws_secret_access_key=os.environ["S3_SECRET_KEY"],
-        endpoint_url=os.environ["S3_ENDPOINT_URL"],
-        region_name="auto",  # Hetzner uses 'auto' region
-    )
-
-
-def save_file_to_s3(file_content: str, s3_key: str, bucket_name: Optional[str] = None) -> bool:
     """
-    Save file content to S3-compatible storage
+    Return the process-wide S3 client with Hetzner Object Storage configuration.
 
-    Args:
-        file_content: Content to save (string)
-        s3_key: S3 object key (path in bucket)
-        bucket_name: S3 bucket name (optional, uses env var if not provided)
-
-    Returns:
-        bool: True if successful, False otherwise
+    The client is created once and reused so uploads share keep-alive HTTPS connections
+    instead of paying a TLS handshake per file. boto3 clients are thread-safe.
     """
+    global _s3_client
+
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                _s3_client = boto3.client(
+                    "s3",
+                    aws_access_key_id=os.environ["S3_ACCESS_KEY"],
+                    aws_secret_access_key=os.environ["S3_SECRET_KEY"],
+                    endpoint_url=os.environ["S3_ENDPOINT_URL"],
+                    region_name="auto",  # Hetzner uses 'auto' region
+                    config=Config(
+                        # Enough connections for every background upload worker plus request threads
+                        max_pool_connections=32,
+                        retries={"max_attempts": 3, "mode": "standard"},
+                    ),
+                )
+    return _s3_client
+
+
+@functools.cache
+def get_default_bucket_name() -> str:
+    """S3_BUCKET_NAME, read once per process instead of on every upload."""
+    return os.environ["S3_BUCKET_NAME"]
+
+
+def _put_to_s3(body: bytes, s3_key: str, bucket_name: Optional[str], content_type: str) -> bool:
+    """Validate the key and put body to S3 - shared by save_file_to_s3 and save_binary_file_to_s3."""
     if bucket_name is None:
-        bucket_name = os.environ["S3_BUCKET_NAME"]
+        bucket_name = get_default_bucket_name()
 
     try:
         # Validate S3 key for security
@@ -81,8 +151,8 @@ def save_file_to_s3(file_content: str, s3_key: str, bucket_name: Optional[str] =
         s3_client.put_object(
             Bucket=bucket_name,
             Key=s3_key,
-            Body=file_content.encode("utf-8"),
-            ContentType="text/plain",
+            Body=body,
+            ContentType=content_type,
         )
         logger.info(f"✅ Saved to S3: s3://{bucket_name}/{s3_key}")
         return True
@@ -91,6 +161,21 @@ def save_file_to_s3(file_content: str, s3_key: str, bucket_name: Optional[str] =
         return False
 
 
+def save_file_to_s3(file_content: str, s3_key: str, bucket_name: Optional[str] = None) -> bool:
+    """
+    Save file content to S3-compatible storage
+
+    Args:
+        file_content: Content to save (string)
+        s3_key: S3 object key (path in bucket)
+        bucket_name: S3 bucket name (optional, uses env var if not provided)
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    return _put_to_s3(file_content.encode("utf-8"), s3_key, bucket_name, "text/plain")
+
+
 def save_binary_file_to_s3(file_content: bytes, s3_key: str, bucket_name: Optional[str] = None) -> bool:
     """
     Save binary file content to S3-compatible storage
@@ -103,21 +188,59 @@ def save_binary_file_to_s3(file_content: bytes, s3_key: str, bucket_name: Option
     Returns:
         bool: True if successful, False otherwise
     """
-    if bucket_name is None:
-        bucket_name = os.environ["S3_BUCKET_NAME"]
+    return _put_to_s3(file_content, s3_key, bucket_name, "application/octet-stream")
+
+
+def _upload_with_retry(save_func: Callable[..., bool], file_content, s3_key: str) -> bool:
+    """Call save_func up to S3_UPLOAD_ATTEMPTS times with exponential backoff until it succeeds."""
+    for attempt in range(S3_UPLOAD_ATTEMPTS):
+        # Callers rarely read the Future, so errors save_func doesn't handle itself (e.g. botocore's
+        # EndpointConnectionError) are logged and retried here instead of vanishing on the Future
+        try:
+            if save_func(file_content, s3_key):
+                return True
+        except Exception as e:
+            logger.error(f"❌ Failed to save to S3 (attempt {attempt + 1}/{S3_UPLOAD_ATTEMPTS}): {s3_key}: {e}")
+        if attempt < S3_UPLOAD_ATTEMPTS - 1:
+            time.sleep(2**attempt)
+    logger.error(f"❌ Giving up on S3 upload after {S3_UPLOAD_ATTEMPTS} attempts: {s3_key}")
+    return False
+
+
+def save_to_s3_in_background(save_func: Callable[..., bool], file_content, s3_key: str) -> Future:
+    """
+    Queue an S3 upload on the background worker pool and return immediately.
 
-    try:
-        # Validate S3 key for security
-        s3_key = validate_s3_key(s3_key)
-        s3_client = get_s3_client()
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=s3_key,
-            Body=file_content,
-            ContentType="application/octet-stream",
-        )
-        logger.info(f"✅ Saved binary to S3: s3://{bucket_name}/{s3_key}")
-        return True
-    except (ClientError, NoCredentialsError, ValueError) as e:
-        logger.error(f"❌ Failed to save binary to S3: {e}")
-        return False
+    Args:
+        save_func: save_file_to_s3 or save_binary_file_to_s3
+        file_content: Content to save (str for save_file_to_s3, bytes for save_binary_file_to_s3)
+        s3_key: S3 object key (path in bucket)
+
+    Returns:
+        Future: Resolves to True if the upload eventually succeeded, False otherwise
+    """
+    return _upload_executor.submit(_upload_with_retry, save_func, file_content, s3_key)
+
+
+def save_files_to_s3(files: list[tuple[str, str]]) -> list[bool]:
+    """
+    Save several text files to S3 concurrently and wait for all of them.
+
+    Uploads run on a small pool reserved for uploads the caller waits on (not the background
+    pool), so the wall time is roughly the slowest upload rather than the sum of all of them.
+
+    Args:
+        files: List of (file_content, s3_key) tuples
+
+    Returns:
+        list[bool]: Per-file success, in the same order as files
+    """
+    futures = [_sync_upload_executor.submit(save_file_to_s3, content, s3_key) for content, s3_key in files]
+    results = []
+    for future, (_, s3_key) in zip(futures, files):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            logger.error(f"❌ Failed to save to S3: {s3_key}: {e}")
+            results.append(False)
+    return results
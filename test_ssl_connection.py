@@ -11,14 +11,16 @@ Usage:
 """
 
 import argparse
-import glob
 import os
+import ssl
 import sys
-import tempfile
+from pathlib import Path
 from urllib.parse import urlparse
 
 import requests
 
+from fina import FinaHTTPAdapter
+
 
 def test_ssl_connection(ca_dir: str, endpoint: str) -> bool:
     """
@@ -29,39 +31,39 @@ def test_ssl_connection(ca_dir: str, endpoint: str) -> bool:
     print(f"📁 Using CA certificates from: {ca_dir}")
     print()
 
-    # Find all .pem files in the CA directory
-    ca_pem_files = glob.glob(os.path.join(ca_dir, "*.pem"))
+    # Find all .pem files in the CA directory (hidden files skipped, as glob.glob did)
+    ca_pem_files = sorted(path for path in Path(ca_dir).glob("*.pem") if not path.name.startswith("."))
     if not ca_pem_files:
         print(f"❌ No .pem files found in {ca_dir}")
         return False
 
     print(f"📜 Found {len(ca_pem_files)} CA certificate(s):")
-    for ca_file in sorted(ca_pem_files):
-        print(f"   - {os.path.basename(ca_file)}")
+    for ca_file in ca_pem_files:
+        print(f"   - {ca_file.name}")
     print()
 
-    # Read and combine all CA certificates
-    combined_ca = b""
-    for ca_file in sorted(ca_pem_files):
-        with open(ca_file, "rb") as f:
-            combined_ca += f.read()
-            combined_ca += b"\n"
+    # Read and combine all CA certificates in a single join
+    combined_ca = b"\n".join(ca_file.read_bytes() for ca_file in ca_pem_files) + b"\n"
 
-    # Create temporary CA bundle file
-    with tempfile.NamedTemporaryFile(mode="wb", suffix=".pem", delete=False) as ca_bundle_file:
-        ca_bundle_file.write(combined_ca)
-        ca_bundle_path = ca_bundle_file.name
+    # Trust only these CAs, loaded straight from memory - the same SSLContext setup fina.py uses
+    try:
+        ssl_context = ssl.create_default_context(cadata=combined_ca.decode())
+    except (ssl.SSLError, ValueError) as e:
+        print("❌ Could not load CA certificates!")
+        print(f"   Error: {e}")
+        print()
+        print("💡 CA certificates are in wrong format (expected PEM)")
+        return False
 
     try:
         print("🔐 Testing SSL handshake...")
 
         # Try to establish SSL connection without sending actual data
-        # We use a simple GET request with a short timeout
-        response = requests.get(
-            endpoint,
-            verify=ca_bundle_path,
-            timeout=10,
-        )
+        # We use a simple GET request with a short timeout; the session keeps the verified TLS
+        # connection for any further requests made through it
+        with requests.Session() as session:
+            session.mount("https://", FinaHTTPAdapter(ssl_context))
+            response = session.get(endpoint, timeout=10)
 
         print("✅ SSL handshake successful!")
         print(f"   Status code: {response.status_code}")
@@ -120,13 +122,6 @@ def test_ssl_connection(ca_dir: str, endpoint: str) -> bool:
         print(f"   Error: {e}")
         return False
 
-    finally:
-        # Clean up temporary file
-        try:
-            os.unlink(ca_bundle_path)
-        except OSError:
-            pass
-
 
 def main():
     parser = argparse.ArgumentParser(